@@ -1,7 +1,22 @@
 #!/usr/bin/env python3
-import gi
-gi.require_version("Gtk", "3.0")
-from gi.repository import Gtk, Gdk
+import startup
+import argparse
+parser = argparse.ArgumentParser()
+parser.add_argument("--profile-startup", action="store_true", help="print a timeline of startup phases once the first frame is painted")
+parser.add_argument("--watchdog", type=float, metavar="MS", help="report main loop iterations that take longer than this, with a stack sample")
+parser.add_argument("--trace", metavar="FILE", help="record main loop activity and write it as Chrome trace-event JSON on exit")
+parser.add_argument("--record", metavar="FILE", help="record everything the widgets' providers publish")
+parser.add_argument("--replay", metavar="FILE", help="feed the widgets a recording instead of live data, then exit")
+parser.add_argument("--replay-speed", type=float, default=1, metavar="N", help="replay N times faster than recorded; 0 for as fast as possible")
+parser.add_argument("--metrics-socket", metavar="PATH", help="serve per-widget call counts and timings as JSON on this Unix socket")
+args = parser.parse_args()
+if args.profile_startup:
+	startup.enable()
+
+with startup.span("import gtk"):
+	import gi
+	gi.require_version("Gtk", "3.0")
+	from gi.repository import Gtk, Gdk, GLib
 
 import os
 import sys
@@ -10,16 +25,30 @@ sys.stderr = os.fdopen(sys.stderr.fileno(), "w", 1)
 
 import signal
 import asyncio
+import time
+import traceback
+import cairo
 
-import aioglib
+with startup.span("import aioglib"):
+	import aioglib
+import frame
+import metrics
+import tracing
+import policy
+import provider
+import replay
+import xconn
 asyncio.get_event_loop_policy().set_event_loop(aioglib.GLibEventLoop())
 asyncio.get_event_loop_policy().set_child_watcher(aioglib.GLibChildWatcher())
+if args.trace:
+	tracing.enable()
 
 # asyncio.get_event_loop_policy().get_event_loop().set_debug(True)
 # import logging
 # logging.basicConfig(level=logging.DEBUG)
 
-def get_config():
+def get_config(reload=False):
+	import importlib
 	import importlib.util
 	import appdirs
 	import os.path
@@ -33,53 +62,85 @@ def get_config():
 			pass
 	else:
 		import config
-		return config
+		return importlib.reload(config) if reload else config
+
+with startup.span("config"):
+	config = get_config()
+
+with startup.span("css"):
+	style_provider = Gtk.CssProvider()
+	style_provider.load_from_data(config.CSS.encode())
+	Gtk.StyleContext.add_provider_for_screen(Gdk.Screen.get_default(), style_provider, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION)
+
+class Strut:
+	# Reserves space at the bottom of a monitor (the primary one if None), and
+	# only talks to the X server when that monitor's geometry actually changes
+	def __init__(self, win, monitor=None):
+		self.win = win
+		self.monitor = monitor
+		self.key = None
 
-config = get_config()
+		screen = win.get_screen()
+		handlers = [
+			screen.connect("monitors-changed", self.update),
+			screen.connect("size-changed", self.update),
+		]
+		win.connect("realize", self.update)
+		win.connect("destroy", lambda win: [screen.disconnect(h) for h in handlers])
 
-style_provider = Gtk.CssProvider()
-style_provider.load_from_data(config.CSS.encode())
-Gtk.StyleContext.add_provider_for_screen(Gdk.Screen.get_default(), style_provider, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION)
+	def get_monitor(self):
+		if self.monitor is not None:
+			return self.monitor
+		display = self.win.get_display()
+		return display.get_primary_monitor() or display.get_monitor(0)
 
-def create_strut(win):
-	from Xlib import display, Xatom
-	mon = Gdk.Display.get_default().get_primary_monitor()
-	def update(mon):
+	def update(self, *_):
+		if self.win.get_window() is None: return
+		mon = self.get_monitor()
 		geom = mon.get_geometry()
+		scale = mon.get_scale_factor()
+		screen_height = self.win.get_screen().get_height()
 
-		disp = display.Display()
-		xwin = disp.create_resource_object("window", win.get_window().get_xid())
+		key = (geom.x, geom.y, geom.width, geom.height, scale, screen_height, config.HEIGHT)
+		if key == self.key: return
+		self.key = key
+
+		from Xlib import Xatom
+		bottom = (screen_height - geom.y - geom.height + config.HEIGHT) * scale
+		start, end = geom.x * scale, (geom.x + geom.width) * scale - 1
+
+		disp = xconn.get()
+		xwin = disp.create_resource_object("window", self.win.get_window().get_xid())
 		xwin.change_property(
 			disp.intern_atom("_NET_WM_STRUT"),
 			Xatom.CARDINAL,
 			32,
-			[0,0,0,config.HEIGHT])
+			[0,0,0,bottom])
 		xwin.change_property(
 			disp.intern_atom("_NET_WM_STRUT_PARTIAL"),
 			Xatom.CARDINAL,
 			32,
-			[0,0,0,config.HEIGHT, 0,0, 0,0, 0,0, 0,geom.width])
-		disp.sync()
-	mon.connect("invalidate", update)
-	update(mon)
+			[0,0,0,bottom, 0,0, 0,0, 0,0, start,end])
+		disp.flush()
 
-def mkwin():
+def mkwin(monitor=None):
 	w = Gtk.Window()
 	w.set_type_hint(Gdk.WindowTypeHint.DOCK)
 	w.set_decorated(False)
 	w.set_app_paintable(True)
 	w.set_visual(Gdk.Screen.get_default().get_rgba_visual())
-	w.connect("realize", create_strut)
+	w.strut = Strut(w, monitor)
+	w.connect("style-updated", lambda w: setattr(w, "bg_cache", None))
 	return w
 
-def create_window():
-	bg = mkwin()
+def create_window(monitor=None):
+	bg = mkwin(monitor)
 	bg.realize()
 	bg.resize(1, config.HEIGHT)
 	bg.get_window().set_child_input_shapes()
 	bg.set_name("bg")
 
-	fg = mkwin()
+	fg = mkwin(monitor)
 	fg.realize()
 	fg.get_window().set_override_redirect(True)
 	fg.set_name("fg")
@@ -97,53 +158,228 @@ def create_window():
 
 	return bg, fg
 
+def create_single_window(monitor=None):
+	# One DOCK window that takes both roles; its input shape comes from its children
+	win = mkwin(monitor)
+	win.realize()
+	win.resize(1, config.HEIGHT)
+	win.set_name("fg")
+	return win
+
 def draw_bg(self, cr, alpha):
+	# The background is rendered once per size/style and then just blitted; the
+	# clip GTK gives us limits that to the damaged area
 	style = self.get_style_context()
 	w, h = self.get_allocated_width(), self.get_allocated_height()
-	cr.push_group()
-	Gtk.render_background(style, cr, 0, 0, w, h)
-	cr.pop_group_to_source()
-	cr.paint_with_alpha(alpha)
+	key = (w, h, alpha, style.get_state(), self.get_scale_factor())
+	cache = getattr(self, "bg_cache", None)
+	if cache is None or cache[0] != key:
+		surface = cr.get_target().create_similar(cairo.CONTENT_COLOR_ALPHA, w, h)
+		scr = cairo.Context(surface)
+		scr.push_group()
+		Gtk.render_background(style, scr, 0, 0, w, h)
+		scr.pop_group_to_source()
+		scr.paint_with_alpha(alpha)
+		cache = self.bg_cache = (key, surface)
+	cr.set_source_surface(cache[1], 0, 0)
+	cr.paint()
 
-def __main__():
-	bg, fg = create_window()
-	box = Gtk.Box()
-	fg.connect("draw", draw_bg, 1/2)
-	bg.connect("draw", draw_bg, 3/4)
-	fg.add(box)
-	right = []
-
-	def update_seps(_=None):
+class InputShapes:
+	# Input shapes only change with the layout, so they're recomputed (once) after
+	# allocation or visibility changes rather than on every draw
+	def __init__(self, box, win):
+		self.box = box
+		self.win = win
+		self.count = 0
+		self.skipped = 0
+		self.last = None
+		self.pending = False
+
+	def queue(self, *_):
+		if not self.pending:
+			self.pending = True
+			GLib.idle_add(self.update)
+
+	def signature(self):
+		# Input shapes follow the children's visibility and allocations
+		sig = [tuple(self.win.get_size())]
+		def add(w):
+			a = w.get_allocation()
+			sig.append((w.get_visible(), a.x, a.y, a.width, a.height))
+		self.box.foreach(add)
+		return sig
+
+	def update(self):
+		self.pending = False
+		if self.win.get_window() is not None:
+			sig = self.signature()
+			if sig == self.last:
+				self.skipped += 1
+				return False
+			self.last = sig
+			self.count += 1
+			self.box.get_window().set_child_input_shapes()
+			self.win.get_window().set_child_input_shapes()
+		return False
+
+class Bar:
+	# One bar on one monitor (or wherever the WM puts it, if monitor is None).
+	# Widgets are cheap views; the sampling behind them is shared between bars.
+	def __init__(self, monitor=None):
+		self.monitor = monitor
+		if getattr(config, "SINGLE_WINDOW", False):
+			self.bg = self.fg = create_single_window(monitor)
+			self.fg.connect("draw", draw_bg, 1 - (1-3/4) * (1-1/2)) # Same as fg at 1/2 over bg at 3/4
+		else:
+			self.bg, self.fg = create_window(monitor)
+			self.fg.connect("draw", draw_bg, 1/2)
+			self.bg.connect("draw", draw_bg, 3/4)
+		self.box = Gtk.Box()
+		self.fg.add(self.box)
+		self.right = []
+
+		self.shapes = InputShapes(self.box, self.fg)
+		self.box.connect("size-allocate", self.shapes.queue)
+		self.fg.connect("configure-event", self.shapes.queue)
+		self.fg.connect("map", self.shapes.queue)
+
+		policy.watch_window(self.bg)
+		if args.trace:
+			tracing.watch_window(self.fg)
+
+		self.populate()
+		self.place()
+
+		self.box.show()
+		self.bg.show()
+		self.fg.show_all()
+		self.update_seps()
+
+	def update_seps(self, _=None):
 		lastVisible = False
-		for w, sep in right:
+		for w, sep in self.right:
 			sep.set_visible(lastVisible)
 			lastVisible = w.is_visible()
 
-	from widgets import Separator
+	def populate(self):
+		from widgets import Separator
+
+		widgets = []
+		for w in startup.timed(config.left(), "left"):
+			self.box.pack_start(w, False, False, 1)
+			widgets.append(w)
+
+		for w in startup.timed(config.right(), "right"):
+			sep = Separator()
+			self.right.append((w, sep))
+			w.connect("show", self.update_seps)
+			w.connect("hide", self.update_seps)
+			self.box.pack_end(sep, False, False, 0)
+			self.box.pack_end(w, False, False, 4)
+			widgets.append(w)
+
+		if args.trace:
+			for w in widgets:
+				tracing.watch_widget(w)
+
+		if self.monitor is not None:
+			for w in widgets:
+				if hasattr(w, "set_output"):
+					w.set_output(self.monitor.get_model())
+
+	def rebuild(self):
+		# Only the views are rebuilt; the shared providers behind them, and
+		# whatever they've already loaded, carry over to the new ones
+		for w in self.box.get_children():
+			w.destroy()
+		self.right = []
+		self.populate()
+		if self.monitor is None:
+			self.bg.resize(1, config.HEIGHT)
+		self.place()
+		for win in {self.bg, self.fg}:
+			win.strut.update()
+		# Views that were filled in hidden from cached values are left out of
+		# show_all() by frame.set_visible
+		self.fg.show_all()
+		self.update_seps()
 
-	for w in config.left():
-		box.pack_start(w, False, False, 1)
+	def place(self):
+		if self.monitor is None: return
+		geom = self.monitor.get_geometry()
+		self.bg.move(geom.x, geom.y + geom.height - config.HEIGHT)
+		self.bg.resize(geom.width, config.HEIGHT)
 
-	for w in config.right():
-		sep = Separator()
-		right.append((w, sep))
-		w.connect("show", update_seps)
-		w.connect("hide", update_seps)
-		box.pack_end(sep, False, False, 0)
-		box.pack_end(w, False, False, 4)
+	def destroy(self):
+		self.fg.destroy()
+		self.bg.destroy()
 
-	def set_shape(win, *_):
-		box.get_window().set_child_input_shapes()
-		fg.get_window().set_child_input_shapes()
+def __main__():
+	if args.replay:
+		provider.replaying = True
+	if args.record:
+		recorder = replay.record(args.record)
+
+	display = Gdk.Display.get_default()
+	bars = {}
+	if getattr(config, "MONITORS", "primary") == "all":
+		def add(display, mon):
+			bars[mon] = Bar(mon)
+		def remove(display, mon):
+			if mon in bars:
+				bars.pop(mon).destroy()
+		for i in range(display.get_n_monitors()):
+			with startup.span(f"bar {i}"):
+				add(display, display.get_monitor(i))
+		display.connect("monitor-added", add)
+		display.connect("monitor-removed", remove)
+	else:
+		with startup.span("bar"):
+			bars[None] = Bar()
+	if startup.enabled and bars:
+		startup.report_on_first_frame(next(iter(bars.values())).fg)
+
+	policy.watch_session(getattr(config, "IDLE_AFTER", 300))
 
-	fg.connect("draw", set_shape)
+	if args.watchdog:
+		import watchdog
+		watchdog.Watchdog(args.watchdog / 1000).start()
+
+	if args.metrics_socket:
+		metrics.gauge("input shape updates", lambda: sum(bar.shapes.count for bar in bars.values()))
+		metrics.gauge("input shape updates skipped", lambda: sum(bar.shapes.skipped for bar in bars.values()))
+		metrics.gauge("bars", lambda: len(bars))
+		metrics.gauge("skipped widget updates", lambda: frame.skipped)
+		asyncio.ensure_future(metrics.serve(args.metrics_socket))
+
+	def reload():
+		global config
+		start = time.perf_counter()
+		try:
+			new = get_config(reload=True)
+			style_provider.load_from_data(new.CSS.encode())
+		except Exception:
+			traceback.print_exc()
+			return True
+		for option in ["MONITORS", "SINGLE_WINDOW"]:
+			if getattr(new, option, None) != getattr(config, option, None):
+				print(f"reload: {option} only takes effect after a restart", file=sys.stderr)
+		config = new
+		for bar in bars.values():
+			bar.rebuild()
+		stopped = provider.prune()
+		print(f"reload: done in {(time.perf_counter() - start)*1000:.0f} ms, stopped {stopped} unused providers", file=sys.stderr)
+		return True
+	GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGHUP, reload)
 
-	box.show()
-	bg.show()
-	fg.show_all()
-	update_seps()
+	if args.replay:
+		asyncio.ensure_future(replay.replay(args.replay, args.replay_speed, asyncio.get_event_loop().stop))
 
 	signal.signal(signal.SIGINT, lambda s, f: asyncio.get_event_loop().stop())
 	asyncio.get_event_loop().run_forever()
+	if args.trace:
+		tracing.save(args.trace)
+	if args.record:
+		recorder.close()
 
 if __name__ == "__main__": __main__()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# Local stand-ins for the bar's backends, run in their own process so they
+# don't count towards the bar's CPU time. Usage: fakes.py DIR [--rate N]
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import stat
+import struct
+import sys
+import time
+
+MPD_SONGS = (20, 50) # Directories, songs per directory
+WORKSPACES = ["1", "2", "3", "4", "5", "6", "7", "8", "9", "10"]
+FEED_ITEMS = 50
+
+#{{{1 MPD
+class FakeMPD:
+	# Speaks just enough of the MPD protocol for MpdClient: status, currentsong,
+	# lsinfo and idle, which reports a player change rate times per second
+	def __init__(self, rate):
+		self.rate = rate
+		self.song = 0
+		self.start = time.monotonic()
+		self.changed = asyncio.Condition()
+		self.library = {"": [("directory", f"Artist {i}") for i in range(MPD_SONGS[0])]}
+		for i in range(MPD_SONGS[0]):
+			self.library[f"Artist {i}"] = [("file", f"Artist {i}/{j:02} Song {j}.flac") for j in range(MPD_SONGS[1])]
+
+	async def tick(self):
+		while True:
+			await asyncio.sleep(1 / self.rate)
+			self.song += 1
+			self.start = time.monotonic()
+			async with self.changed:
+				self.changed.notify_all()
+
+	def status(self):
+		return [
+			("state", "play"),
+			("single", "0"),
+			("repeat", "1"),
+			("random", "0"),
+			("song", str(self.song)),
+			("elapsed", f"{time.monotonic() - self.start:.3f}"),
+			("duration", "240.000"),
+		]
+
+	def currentsong(self):
+		return [
+			("file", f"Artist 0/{self.song % 100:02} Song {self.song}.flac"),
+			("Title", f"Song {self.song}"),
+			("Artist", "Artist 0"),
+			("Track", str(self.song % 100)),
+		]
+
+	def lsinfo(self, path=""):
+		out = []
+		for k, v in self.library.get(path, []):
+			out.append((k, v))
+			if k == "file":
+				out.append(("Title", os.path.basename(v)[3:-5]))
+		return out
+
+	async def client(self, reader, writer):
+		writer.write(b"OK MPD 0.20.0\n")
+		while True:
+			line = await reader.readline()
+			if not line: break
+			command, *args = line.decode().rstrip("\n").split(" ", 1)
+			args = [a.strip('"').replace('\\"', '"').replace("\\\\", "\\") for a in args]
+			if command == "status":
+				reply = self.status()
+			elif command == "currentsong":
+				reply = self.currentsong()
+			elif command == "lsinfo":
+				reply = self.lsinfo(*args)
+			elif command == "idle":
+				async with self.changed:
+					await self.changed.wait()
+				reply = [("changed", "player")]
+			else:
+				reply = []
+			writer.write("".join(f"{k}: {v}\n" for k, v in reply).encode() + b"OK\n")
+			await writer.drain()
+		writer.close()
+
+#{{{1 i3
+class FakeI3:
+	# The i3 IPC framing ("i3-ipc", length, type, JSON payload) with the
+	# messages the ws provider uses; the focus moves rate times per second
+	COMMAND, GET_WORKSPACES, SUBSCRIBE, GET_BAR_CONFIG = 0, 1, 2, 6
+	E_WORKSPACE, E_BARCONFIG_UPDATE = 0, 4
+	EVENT = 1 << 31
+
+	def __init__(self, rate):
+		self.rate = rate
+		self.focused = 0
+		self.subscribers = []
+
+	def workspaces(self):
+		return [{
+			"name": name,
+			"num": i + 1,
+			"focused": i == self.focused,
+			"visible": i == self.focused,
+			"urgent": i == (self.focused + 3) % len(WORKSPACES),
+			"output": "default",
+		} for i, name in enumerate(WORKSPACES)]
+
+	def send(self, writer, type, payload):
+		data = json.dumps(payload).encode()
+		writer.write(b"i3-ipc" + struct.pack("=II", len(data), type) + data)
+
+	async def tick(self):
+		while True:
+			await asyncio.sleep(1 / self.rate)
+			self.focused = (self.focused + 1) % len(WORKSPACES)
+			for writer in list(self.subscribers):
+				self.send(writer, self.EVENT | self.E_WORKSPACE, {"change": "focus"})
+
+	async def client(self, reader, writer):
+		try:
+			while True:
+				header = await reader.readexactly(14)
+				length, type = struct.unpack("=II", header[6:])
+				payload = (await reader.readexactly(length)).decode()
+				if type == self.GET_WORKSPACES:
+					self.send(writer, type, self.workspaces())
+				elif type == self.SUBSCRIBE:
+					self.subscribers.append(writer)
+					self.send(writer, type, {"success": True})
+				elif type == self.GET_BAR_CONFIG:
+					if payload:
+						self.send(writer, type, {"id": payload, "colors": {"focused_workspace_bg": "#285577"}})
+					else:
+						self.send(writer, type, ["bar-0"])
+				else:
+					self.send(writer, type, [{"success": True}])
+		except asyncio.IncompleteReadError:
+			pass
+		if writer in self.subscribers:
+			self.subscribers.remove(writer)
+		writer.close()
+
+#{{{1 Feeds
+def rss(n):
+	items = "".join(f"""
+		<item>
+			<title>Entry {i}</title>
+			<link>http://localhost/entry/{i}</link>
+			<description>Entry number {i}</description>
+			<pubDate>Mon, 01 Jan 2018 00:00:00 +0000</pubDate>
+		</item>""" for i in range(n))
+	return f"""<?xml version="1.0"?>
+<rss version="2.0">
+	<channel>
+		<title>Bench feed</title>
+		<link>http://localhost/</link>
+		<description>Generated</description>{items}
+	</channel>
+</rss>
+""".encode()
+
+async def http_client(reader, writer):
+	while (await reader.readline()).strip(): pass # Request line and headers are ignored
+	body = rss(FEED_ITEMS)
+	writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/rss+xml\r\nConnection: close\r\n")
+	writer.write(f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+	await writer.drain()
+	writer.close()
+
+#{{{1 Files
+def write_files(dir):
+	# A power_supply directory for Battery, a sensors script for Temperature,
+	# and a history database for Feeds
+	bat = os.path.join(dir, "BAT0")
+	os.makedirs(bat, exist_ok=True)
+	for k, v in {
+		"status": "Full",
+		"present": "1",
+		"capacity": "97",
+		"energy_now": "48500000",
+		"energy_full": "50000000",
+		"energy_design": "57000000",
+		"power_now": "0",
+		"voltage_now": "12600000",
+		"voltage_min_design": "11400000",
+	}.items():
+		with open(os.path.join(bat, k), "w") as f:
+			f.write(v + "\n")
+
+	bin = os.path.join(dir, "bin")
+	os.makedirs(bin, exist_ok=True)
+	sensors = os.path.join(bin, "sensors")
+	with open(sensors, "w") as f:
+		f.write(f"""#!{sys.executable}
+import random
+print("coretemp-isa-0000")
+print("Adapter: ISA adapter")
+for i in range(4):
+	print("Core %d:" % i if i else "Package id 0:")
+	print("  temp%d_input: %.3f" % (i+1, random.uniform(40, 60)))
+	print("  temp%d_max: 100.000" % (i+1))
+	print("  temp%d_crit: 100.000" % (i+1))
+print()
+""")
+	os.chmod(sensors, os.stat(sensors).st_mode | stat.S_IXUSR)
+
+	db = sqlite3.connect(os.path.join(dir, "history.sqlite"))
+	db.execute("CREATE TABLE IF NOT EXISTS history (url TEXT)")
+	db.execute("DELETE FROM history")
+	db.executemany("INSERT INTO history VALUES (?)", [(f"http://localhost/entry/{i}",) for i in range(0, FEED_ITEMS, 2)])
+	db.commit()
+	db.close()
+#}}}1
+
+async def main(dir, rate):
+	write_files(dir)
+	mpd = FakeMPD(rate)
+	i3 = FakeI3(rate)
+	await asyncio.start_unix_server(mpd.client, os.path.join(dir, "mpd.sock"))
+	await asyncio.start_unix_server(i3.client, os.path.join(dir, "i3.sock"))
+	http = await asyncio.start_server(http_client, "127.0.0.1", 0)
+	port = http.sockets[0].getsockname()[1]
+	print(f"ready {port}", flush=True)
+	await asyncio.gather(mpd.tick(), i3.tick())
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser()
+	parser.add_argument("dir")
+	parser.add_argument("--rate", type=float, default=1, help="MPD and i3 events per second")
+	args = parser.parse_args()
+	asyncio.run(main(args.dir, args.rate))
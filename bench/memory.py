@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# Drives the paths that allocate GTK objects over and over (feed menu
+# rebuilds, the Temperature tooltip, reopening the Clock calendar popup) thousands of
+# times, and fails if RSS or object counts keep growing after a warm-up.
+import argparse
+import collections
+import gc
+import os
+import resource
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--iterations", type=int, default=500, help="calls per round")
+parser.add_argument("--rounds", type=int, default=6, help="measured rounds, after one warm-up round")
+parser.add_argument("--only", help="comma separated subset of: Feeds, Temperature, Clock")
+parser.add_argument("--max-rss-growth", type=float, default=4096, metavar="KIB", help="RSS growth over the measured rounds that counts as a leak")
+args = parser.parse_args()
+
+if not os.environ.get("DISPLAY") and shutil.which("xvfb-run"):
+	os.execvp("xvfb-run", ["xvfb-run", "-a", sys.executable] + sys.argv)
+
+# Lets GLib count live instances per GType; has to be set before GObject starts
+os.environ["GOBJECT_DEBUG"] = ",".join(filter(None, [os.environ.get("GOBJECT_DEBUG"), "instance-count"]))
+
+dir = tempfile.mkdtemp(prefix="icebar-memory-")
+sys.path.insert(0, ROOT)
+import fakes
+fakes.write_files(dir)
+os.environ["PATH"] = os.path.join(dir, "bin") + os.pathsep + os.environ["PATH"]
+
+import gi
+gi.require_version("Gtk", "3.0")
+from gi.repository import Gtk, Gdk, GObject, GLib
+import asyncio
+import aioglib
+asyncio.get_event_loop_policy().set_event_loop(aioglib.GLibEventLoop())
+
+import provider
+import widgets
+provider.replaying = True # Values are published by the drivers, not sampled
+
+GTYPES = ["GtkWindow", "GtkMenu", "GtkMenuItem", "GtkImageMenuItem", "GtkImage", "GtkLabel", "GtkBox", "GtkCalendar"]
+
+#{{{1 Drivers
+def drive_feeds():
+	w = widgets.Feeds(
+		(os.path.join(dir, "history.sqlite"), "SELECT url FROM history WHERE url IN ({})"),
+		[widgets.RSSFeed("bench", "http://localhost/feed.xml")])
+	loop = asyncio.get_event_loop()
+	entries = [(f"Entry {i}", f"http://localhost/entry/{i}") for i in range(fakes.FEED_ITEMS)]
+	w.provider.publish("visited", {url for _, url in entries[::2]})
+	def step():
+		# What the hourly refetch does
+		w.provider.publish("feeds", [("Bench feed", "http://localhost/", entries)])
+		loop.run_until_complete(w.tasks["feeds"])
+		loop.run_until_complete(w.tasks["visited"])
+	return w, step
+
+def drive_temperature():
+	from widgets.temperature import get_temps
+	w = widgets.Temperature("coretemp-isa-0000", "Package id 0", 45)
+	tooltip = GObject.new(Gtk.Tooltip)
+	def step():
+		w.provider.publish("temps", list(get_temps()))
+		w.emit("query-tooltip", 0, 0, False, tooltip)
+	return w, step
+
+def drive_clock():
+	w = widgets.Clock()
+	win = Gtk.Window()
+	win.add(w)
+	win.show_all()
+	event = Gdk.Event.new(Gdk.EventType.BUTTON_PRESS)
+	event.button.button = 1
+	def step():
+		w.emit("button-press-event", event)
+		w.popup.hide() # As focus-out would
+	return win, step
+
+drivers = {
+	"Feeds": drive_feeds,
+	"Temperature": drive_temperature,
+	"Clock": drive_clock,
+}
+#}}}1
+
+def settle():
+	# Lets GTK finish pending work (and finalize what it's dropped) before measuring
+	context = GLib.MainContext.default()
+	while context.iteration(False): pass
+	gc.collect()
+
+def rss():
+	with open("/proc/self/statm") as f:
+		return int(f.read().split()[1]) * resource.getpagesize() // 1024
+
+def sample():
+	objects = gc.get_objects()
+	counts = {
+		"rss KiB": rss(),
+		"python objects": len(objects),
+	}
+	wrappers = collections.Counter(type(o).__name__ for o in objects if isinstance(o, GObject.Object))
+	for name, count in wrappers.items():
+		counts[f"wrapper {name}"] = count
+	if hasattr(GObject, "type_get_instance_count"):
+		for name in GTYPES:
+			gtype = GObject.type_from_name(name)
+			if gtype:
+				counts[f"instances {name}"] = GObject.type_get_instance_count(gtype)
+	return counts
+
+def growing(samples, key):
+	# Counts that rose in every measured round aren't going to level off
+	values = [s.get(key, 0) for s in samples]
+	return all(b > a for a, b in zip(values, values[1:]))
+
+def run(name):
+	widget, step = drivers[name]()
+	for _ in range(args.iterations):
+		step()
+	settle()
+
+	samples = [sample()]
+	for _ in range(args.rounds):
+		for _ in range(args.iterations):
+			step()
+		settle()
+		samples.append(sample())
+
+	first, last = samples[0], samples[-1]
+	calls = args.rounds * args.iterations
+	print(f"{name}: {calls} calls after {args.iterations} warm-up calls")
+	failed = []
+	for key in sorted(set(first) | set(last)):
+		delta = last.get(key, 0) - first.get(key, 0)
+		if not delta: continue
+		flag = ""
+		if key == "rss KiB":
+			if delta > args.max_rss_growth:
+				flag = "  <- leak"
+		elif growing(samples, key):
+			flag = "  <- leak"
+		if flag:
+			failed.append(key)
+		print(f"  {key:32} {first.get(key, 0):10} -> {last.get(key, 0):10} ({delta / calls:+.3f}/call){flag}")
+	widget.destroy()
+	settle()
+	return failed
+
+def main():
+	names = args.only.split(",") if args.only else list(drivers)
+	failures = {}
+	for name in names:
+		failed = run(name)
+		if failed:
+			failures[name] = failed
+	if failures:
+		sys.exit("unbounded growth in " + "; ".join(f"{name}: {', '.join(keys)}" for name, keys in failures.items()))
+
+try:
+	main()
+finally:
+	shutil.rmtree(dir, ignore_errors=True)
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# Micro-benchmarks for the data parsing hot paths, over generated inputs of
+# realistic worst-case size. Reports best/median time, throughput and
+# allocations (via tracemalloc), and can save results as a baseline and
+# compare later runs against it:
+#   parsers.py --save baseline.json
+#   parsers.py --compare baseline.json
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--scale", type=float, default=1, help="multiplies the size of every generated input")
+parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark")
+parser.add_argument("--only", help="comma separated benchmark names")
+parser.add_argument("--save", metavar="FILE", help="write the results as a baseline")
+parser.add_argument("--compare", metavar="FILE", help="compare against a saved baseline")
+parser.add_argument("--tolerance", type=float, default=0.15, help="slowdown or allocation growth (as a fraction) that counts as a regression")
+args = parser.parse_args()
+
+# search_tree needs a TreeView, and so a display
+if not os.environ.get("DISPLAY") and shutil.which("xvfb-run"):
+	os.execvp("xvfb-run", ["xvfb-run", "-a", sys.executable] + sys.argv)
+
+sys.path.insert(0, ROOT)
+import gi
+gi.require_version("Gtk", "3.0")
+from gi.repository import Gtk
+from widgets import feed, mpd, temperature
+
+def n(count):
+	return max(1, int(count * args.scale))
+
+#{{{1 Generators
+def gen_rss(items, words=200):
+	text = " ".join(f"word{i}" for i in range(words))
+	entries = "".join(f"""
+		<item>
+			<title>Entry {i}</title>
+			<link>https://example.com/entry/{i}</link>
+			<guid>https://example.com/entry/{i}</guid>
+			<category>news</category>
+			<category>bench</category>
+			<description>{text}</description>
+			<pubDate>Mon, 01 Jan 2018 00:00:00 +0000</pubDate>
+		</item>""" for i in range(items))
+	return f"""<?xml version="1.0"?>
+<rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom">
+	<channel>
+		<title>Bench feed</title>
+		<link>https://example.com/</link>
+		<atom:link href="https://example.com/feed.xml" rel="self"/>
+		<description>Generated</description>{entries}
+	</channel>
+</rss>
+""".encode()
+
+def gen_ffn(chapters, paragraphs):
+	options = "".join(f'<option value="{i}">{i}. Chapter {i}</option>' for i in range(1, chapters + 1))
+	story = "".join(f"<p>Paragraph {i} " + "lorem ipsum dolor sit amet " * 20 + "</p>" for i in range(paragraphs))
+	return f"""<!DOCTYPE html>
+<html><head>
+<link rel="canonical" href="https://www.fanfiction.net/s/1/1/Bench-Story">
+</head><body>
+<div id="profile_top"><b>Bench Story</b> by someone</div>
+<select id="chap_select">{options}</select>
+<div id="storytext">{story}</div>
+<select id="chap_select">{options}</select>
+</body></html>
+""".encode()
+
+def gen_lsinfo(songs):
+	lines = []
+	for i in range(songs):
+		artist, album = i // 1000, i // 10
+		lines.append(f"file: Artist {artist}/Album {album}/{i % 10:02} Song {i}.flac\n"
+			f"Last-Modified: 2018-01-01T00:00:00Z\n"
+			f"Time: 240\nduration: 240.000\n"
+			f"Artist: Artist {artist}\nAlbum: Album {album}\nTitle: Song {i}\nTrack: {i % 10}\n")
+	return ("".join(lines) + "OK\n").encode()
+
+def gen_sensors(chips, sensors):
+	out = []
+	for c in range(chips):
+		out.append(f"chip{c}-isa-{c:04}\nAdapter: ISA adapter\n")
+		for s in range(sensors):
+			out.append(f"Core {s}:\n  temp{s+1}_input: {40 + s % 20}.000\n  temp{s+1}_max: 100.000\n"
+				f"  temp{s+1}_crit: 100.000\n  temp{s+1}_crit_alarm: 0.000\n")
+		out.append("\n")
+	return "".join(out)
+
+def gen_tree(rows):
+	# Artist/album/song, like MPDProvider's tree store
+	store = Gtk.TreeStore(str, str, str)
+	per_album, per_artist = 10, 10
+	for a in range(max(1, rows // (per_album * per_artist))):
+		artist = store.append(None, row=[f"Artist {a}", f"Artist {a}", f"Artist {a}"])
+		for b in range(per_artist):
+			album = store.append(artist, row=[f"Album {b}", f"Album {b}", f"Artist {a}/Album {b}"])
+			for s in range(per_album):
+				name = f"Song {a}-{b}-{s}"
+				store.append(album, row=[f"{s:02} {name}", name, f"Artist {a}/Album {b}/{s:02} {name}.flac"])
+	return store
+
+#{{{1 Benchmarks
+def bench_parse_rss():
+	data = gen_rss(n(2000))
+	return len(data), "B", lambda: feed.parse_rss(data)
+
+def bench_ffn_load():
+	data = gen_ffn(n(500), n(2000))
+	ffn = feed.FFNFeed("bench", 1)
+	return len(data), "B", lambda: ffn.load(data)
+
+def bench_mpd_recv():
+	data = gen_lsinfo(n(100000))
+	loop = asyncio.new_event_loop()
+	async def recv():
+		client = mpd.MpdClient()
+		client.r = asyncio.StreamReader(limit=2**20)
+		client.r.feed_data(data)
+		client.r.feed_eof()
+		return await client.recv()
+	return len(data), "B", lambda: loop.run_until_complete(recv())
+
+def bench_parse_sensors():
+	data = gen_sensors(n(50), n(32))
+	return len(data), "B", lambda: list(temperature.parse_sensors(data))
+
+def bench_search_tree():
+	rows = n(100000)
+	store = gen_tree(rows)
+	tree = Gtk.TreeView(store)
+	def search():
+		# What a TreeView search does: the equal func for every top level row
+		for row in store:
+			mpd.search_tree(store, 1, "Song 7-3-", row.iter, tree)
+	return rows, "rows", search
+
+benchmarks = {
+	"parse_rss": bench_parse_rss,
+	"FFNFeed.load": bench_ffn_load,
+	"MpdClient.recv": bench_mpd_recv,
+	"parse_sensors": bench_parse_sensors,
+	"search_tree": bench_search_tree,
+}
+#}}}1
+
+def measure(setup):
+	size, unit, f = setup()
+	f() # Warm up caches and lazy imports
+	times = []
+	for _ in range(args.repeat):
+		start = time.perf_counter()
+		f()
+		times.append(time.perf_counter() - start)
+	tracemalloc.start()
+	result = f()
+	current, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	del result
+	best = min(times)
+	return {
+		"size": size,
+		"unit": unit,
+		"best": best,
+		"median": statistics.median(times),
+		"throughput": size / best,
+		"peak_alloc": peak,
+		"retained": current,
+	}
+
+def compare(results, baseline):
+	regressions = []
+	for name, r in results.items():
+		if name not in baseline: continue
+		b = baseline[name]
+		if b["size"] != r["size"]:
+			print(f"{name}: input size differs from the baseline ({b['size']} vs {r['size']}), not compared")
+			continue
+		time_ratio = r["best"] / b["best"]
+		alloc_ratio = r["peak_alloc"] / max(1, b["peak_alloc"])
+		print(f"{name:16} time {time_ratio:6.2f}x  peak alloc {alloc_ratio:6.2f}x")
+		if time_ratio > 1 + args.tolerance or alloc_ratio > 1 + args.tolerance:
+			regressions.append(name)
+	return regressions
+
+def main():
+	names = args.only.split(",") if args.only else list(benchmarks)
+	results = {}
+	print(f"{'benchmark':16} {'size':>12} {'best ms':>10} {'median ms':>10} {'throughput':>16} {'peak KiB':>10} {'kept KiB':>10}")
+	for name in names:
+		r = results[name] = measure(benchmarks[name])
+		print(f"{name:16} {r['size']:>10} {r['unit']:>1} {r['best']*1000:10.2f} {r['median']*1000:10.2f} "
+			f"{r['throughput']:12.0f} {r['unit']}/s {r['peak_alloc']/1024:10.0f} {r['retained']/1024:10.0f}")
+
+	if args.save:
+		with open(args.save, "w") as f:
+			json.dump(results, f, indent="\t")
+	if args.compare:
+		with open(args.compare) as f:
+			regressions = compare(results, json.load(f))
+		if regressions:
+			sys.exit(f"regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+
+main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# Builds the bar's widgets against the stand-ins in fakes.py, renders them
+# offscreen and reports updates per second, draw time per widget, and CPU
+# time per hour of simulated uptime. Without a display it reruns itself under
+# xvfb-run, so it works on a CI box with Xvfb installed.
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--duration", type=float, default=30, help="wall clock seconds to run for")
+parser.add_argument("--speed", type=float, default=10, help="how much faster than real time sampling timers run")
+parser.add_argument("--rate", type=float, default=2, help="MPD and i3 events per second")
+parser.add_argument("--draws", type=int, default=200, help="offscreen renders per widget when timing draws")
+parser.add_argument("--widgets", help="comma separated subset of: " + ", ".join(["Workspaces", "Clock", "Battery", "Temperature", "RAM", "CPUGraph", "Wifi", "MPD2", "Feeds"]))
+args = parser.parse_args()
+
+if not os.environ.get("DISPLAY") and shutil.which("xvfb-run"):
+	os.execvp("xvfb-run", ["xvfb-run", "-a", sys.executable] + sys.argv)
+
+# The fakes have to be up, and the environment pointing at them, before the
+# widget modules are imported
+dir = tempfile.mkdtemp(prefix="icebar-bench-")
+fakes = subprocess.Popen([sys.executable, os.path.join(HERE, "fakes.py"), dir, "--rate", str(args.rate)], stdout=subprocess.PIPE)
+ready = fakes.stdout.readline().split()
+if ready[:1] != [b"ready"]:
+	sys.exit("bench: fakes failed to start")
+http_port = int(ready[1])
+os.environ["MPD_HOST"] = os.path.join(dir, "mpd.sock")
+os.environ["I3SOCK"] = os.path.join(dir, "i3.sock")
+os.environ["PATH"] = os.path.join(dir, "bin") + os.pathsep + os.environ["PATH"]
+
+sys.path.insert(0, ROOT)
+import gi
+gi.require_version("Gtk", "3.0")
+from gi.repository import Gtk
+import asyncio
+import cairo
+import aioglib
+asyncio.get_event_loop_policy().set_event_loop(aioglib.GLibEventLoop())
+asyncio.get_event_loop_policy().set_child_watcher(aioglib.GLibChildWatcher())
+
+import metrics
+import timer
+import widgets
+import widgets.ws
+
+factories = {
+	"Workspaces": lambda: widgets.ws.Workspaces(widgets.ws.i3),
+	"Clock": lambda: widgets.Clock(),
+	"Battery": lambda: widgets.Battery(os.path.join(dir, "BAT0"), verbose=2),
+	"Temperature": lambda: widgets.Temperature("coretemp-isa-0000", "Package id 0", 45),
+	"RAM": lambda: widgets.RAM(),
+	"CPUGraph": lambda: widgets.CPUGraph(),
+	"Wifi": lambda: widgets.Wifi(),
+	"MPD2": lambda: widgets.MPD2(),
+	"Feeds": lambda: widgets.Feeds(
+		(os.path.join(dir, "history.sqlite"), "SELECT url FROM history WHERE url IN ({})"),
+		[widgets.RSSFeed("bench", f"http://127.0.0.1:{http_port}/feed.xml")]),
+}
+
+def build(names):
+	win = Gtk.OffscreenWindow()
+	box = Gtk.Box(spacing=4)
+	win.add(box)
+	built = {}
+	for name in names:
+		w = factories[name]()
+		box.pack_start(w, False, False, 0)
+		built[name] = w
+	win.show_all()
+	return win, built
+
+def time_draws(widget, n):
+	# Renders the widget into an image surface n times; GTK runs the same draw
+	# path as for a window, minus the compositing
+	alloc = widget.get_allocation()
+	surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, max(1, alloc.width), max(1, alloc.height))
+	start = time.perf_counter()
+	for _ in range(n):
+		cr = cairo.Context(surface)
+		Gtk.Widget.draw(widget, cr) # Not widget.draw, which some widgets define for themselves
+	return (time.perf_counter() - start) / n
+
+def report(built, wall, cpu):
+	snapshot = metrics.snapshot()["widgets"]
+	simulated = wall * args.speed
+	print(f"ran {wall:.1f} s ({simulated:.0f} s simulated), {cpu:.2f} s CPU")
+	print(f"CPU per hour of simulated uptime: {cpu / simulated * 3600:.1f} s")
+	print()
+	print(f"{'class.method':40} {'calls':>8} {'calls/s':>9} {'mean ms':>9} {'cpu ms':>9} {'errors':>7}")
+	for cls, methods in sorted(snapshot.items()):
+		for name, m in sorted(methods.items()):
+			if not m["count"]: continue
+			print(f"{cls + '.' + name:40} {m['count']:8} {m['count'] / wall:9.2f} "
+				f"{m['wall']['total'] / m['count'] * 1000:9.3f} {m['cpu']['total'] / m['count'] * 1000:9.3f} {m['errors']:7}")
+	print()
+	print(f"{'widget':16} {'draw ms':>9}")
+	for name, w in built.items():
+		print(f"{name:16} {time_draws(w, args.draws) * 1000:9.3f}")
+
+def main():
+	names = args.widgets.split(",") if args.widgets else list(factories)
+	timer.scheduler.set_scale(1 / args.speed)
+	win, built = build(names)
+
+	loop = asyncio.get_event_loop()
+	cpu, wall = time.process_time(), time.perf_counter()
+	loop.call_later(args.duration, loop.stop)
+	loop.run_forever()
+	cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+
+	report(built, wall, cpu)
+	win.destroy()
+
+try:
+	main()
+finally:
+	fakes.kill()
+	shutil.rmtree(dir, ignore_errors=True)
@@ -2,13 +2,15 @@ import widgets
 import widgets.ws
 
 HEIGHT = 21
+SINGLE_WINDOW = False # Draw the bar in one window instead of a bg/fg pair
+MONITORS = "primary" # Or "all" for one bar per monitor
 
 CSS = """
 #fg { font-family: monospace; font-size: 9.5pt }
 """
 
 def left():
-	yield widgets.ws.Workspaces(widgets.ws.i3())
+	yield widgets.ws.Workspaces(widgets.ws.i3)
 
 def right():
 	yield widgets.Clock()
@@ -0,0 +1,107 @@
+from gi.repository import Gtk, Gdk, GLib
+
+__all__ = ["defer", "queue_draw", "set_text", "set_markup", "set_opacity", "set_visible"]
+
+class Batch:
+	def __init__(self, clock):
+		self.clock = clock
+		self.pending = {}
+		self.paint_start = 0
+		self.skip = 0
+		self.handlers = [
+			clock.connect("update", self.flush),
+			clock.connect("before-paint", self.before_paint),
+			clock.connect("after-paint", self.after_paint),
+		]
+
+	def close(self):
+		for handler in self.handlers:
+			self.clock.disconnect(handler)
+		self.pending = {}
+
+	def add(self, key, action):
+		if not self.pending:
+			self.clock.request_phase(Gdk.FrameClockPhase.UPDATE)
+		self.pending[key] = action # Only the latest value for each key gets drawn
+
+	def flush(self, clock):
+		if not self.pending: return
+		if self.skip:
+			# The last paint overran its frame, so let this frame go and keep collecting
+			self.skip -= 1
+			clock.request_phase(Gdk.FrameClockPhase.UPDATE)
+			return
+		pending, self.pending = self.pending, {}
+		for action in pending.values():
+			action()
+
+	def before_paint(self, clock):
+		self.paint_start = GLib.get_monotonic_time()
+
+	def after_paint(self, clock):
+		elapsed = GLib.get_monotonic_time() - self.paint_start
+		interval, _ = clock.get_refresh_info(clock.get_frame_time())
+		if interval:
+			self.skip = int(elapsed // interval)
+
+batches = {}
+
+def defer(widget, key, action):
+	clock = widget.get_frame_clock()
+	if clock is None:
+		action()
+		return
+	if clock not in batches:
+		batches[clock] = Batch(clock)
+		# The clock goes with the window (a bar on an unplugged monitor, say),
+		# and so do the updates still pending for its widgets
+		def unrealize(_):
+			if clock in batches:
+				batches.pop(clock).close()
+		widget.get_toplevel().connect("unrealize", unrealize)
+	batches[clock].add(key, action)
+
+def queue_draw(widget):
+	defer(widget, (widget, "draw"), widget.queue_draw)
+
+skipped = 0 # Updates dropped because they wouldn't have changed anything
+
+def changed(widget, key, value):
+	# Remembers the last value asked for, so repeating it doesn't touch GTK
+	global skipped
+	state = getattr(widget, "frame_state", None)
+	if state is None:
+		state = widget.frame_state = {}
+	if key in state and state[key] == value:
+		skipped += 1
+		return False
+	state[key] = value
+	return True
+
+def set_text(label, text):
+	if changed(label, "label", ("text", text)):
+		defer(label, (label, "label"), lambda: label.set_text(text))
+
+def set_markup(label, markup):
+	if changed(label, "label", ("markup", markup)):
+		defer(label, (label, "label"), lambda: label.set_markup(markup))
+
+def set_opacity(widget, opacity):
+	if changed(widget, "opacity", opacity):
+		defer(widget, (widget, "opacity"), lambda: widget.set_opacity(opacity))
+
+def set_visible(widget, visible):
+	# Applied right away, since separators follow show/hide. The widget is
+	# taken out of show_all(), so a bar built (or rebuilt) after its provider
+	# already hid it doesn't show it again; showing it shows its children
+	global skipped
+	widget.set_no_show_all(True)
+	if widget.get_visible() == visible:
+		skipped += 1
+		return
+	if visible:
+		if isinstance(widget, Gtk.Container):
+			widget.foreach(Gtk.Widget.show_all)
+		widget.show()
+	else:
+		widget.hide()
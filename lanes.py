@@ -0,0 +1,39 @@
+from gi.repository import GLib
+import asyncio
+import time
+
+__all__ = ["INPUT", "INTERACTIVE", "BACKGROUND", "idle", "spawn", "Slice"]
+
+# GDK dispatches input at PRIORITY_DEFAULT and paints at PRIORITY_HIGH_IDLE + 20
+INPUT = GLib.PRIORITY_DEFAULT
+INTERACTIVE = GLib.PRIORITY_HIGH_IDLE + 30 # After the redraw, before background work
+BACKGROUND = GLib.PRIORITY_DEFAULT_IDLE
+
+SLICE = 0.005 # Seconds a background coroutine may run before giving way
+
+def idle(lane=BACKGROUND):
+	# Resolves once the main loop has nothing more important than the lane pending
+	fut = asyncio.get_event_loop().create_future()
+	def done():
+		if not fut.done():
+			fut.set_result(None)
+		return False
+	GLib.idle_add(done, priority=lane)
+	return fut
+
+def spawn(coro, lane=INTERACTIVE):
+	async def run():
+		await idle(lane)
+		return await coro
+	return asyncio.ensure_future(run())
+
+class Slice:
+	def __init__(self, lane=BACKGROUND, budget=SLICE):
+		self.lane = lane
+		self.budget = budget
+		self.start = time.perf_counter()
+
+	async def __call__(self):
+		if time.perf_counter() - self.start >= self.budget:
+			await idle(self.lane)
+			self.start = time.perf_counter()
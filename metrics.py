@@ -0,0 +1,140 @@
+import asyncio
+import functools
+import json
+import os
+import time
+import types
+import tracing
+
+__all__ = ["timed", "gauge", "snapshot", "serve"]
+
+BUCKETS = [0.0001, 0.0003, 0.001, 0.003, 0.01, 0.03, 0.1, 0.3, 1, float("inf")] # Upper bounds, in seconds
+
+class Histogram:
+	def __init__(self):
+		self.total = 0
+		self.counts = [0] * len(BUCKETS)
+
+	def add(self, t):
+		self.total += t
+		for i, bound in enumerate(BUCKETS):
+			if t <= bound:
+				self.counts[i] += 1
+				break
+
+	def json(self):
+		return {
+			"total": self.total,
+			"buckets": {f"<={b*1000:g}ms": n for b, n in zip(BUCKETS, self.counts) if n},
+		}
+
+class Metric:
+	def __init__(self):
+		self.count = 0
+		self.wall = Histogram()
+		self.cpu = Histogram()
+		self.errors = 0
+		self.last_error = None
+
+	def add(self, wall, cpu):
+		self.count += 1
+		self.wall.add(wall)
+		self.cpu.add(cpu)
+
+	def error(self, exc):
+		self.errors += 1
+		self.last_error = f"{type(exc).__name__}: {exc}"
+
+	def json(self):
+		return {
+			"count": self.count,
+			"wall": self.wall.json(),
+			"cpu": self.cpu.json(),
+			"errors": self.errors,
+			"last_error": self.last_error,
+		}
+
+metrics = {} # (class, method) -> Metric
+gauges = {} # name -> function returning the current value
+
+def get(cls, name):
+	key = (cls, name)
+	if key not in metrics:
+		metrics[key] = Metric()
+	return metrics[key]
+
+@types.coroutine
+def _steps(coro, metric, name):
+	# Drives coro, counting only the time it spends running towards its CPU time
+	start = time.perf_counter()
+	cpu = 0
+	value, exc = None, None
+	try:
+		while True:
+			t, step = time.thread_time(), time.perf_counter()
+			try:
+				if exc is None:
+					yielded = coro.send(value)
+				else:
+					yielded = coro.throw(exc)
+			except StopIteration as e:
+				return e.value
+			finally:
+				cpu += time.thread_time() - t
+				if tracing.enabled:
+					tracing.complete(name, "update", step, time.perf_counter(), name.split(".")[0])
+			value, exc = None, None
+			try:
+				value = yield yielded
+			except BaseException as e:
+				exc = e
+	except Exception as e:
+		metric.error(e)
+		raise
+	finally:
+		metric.add(time.perf_counter() - start, cpu)
+
+def timed(f):
+	# Records calls, wall and CPU time, and errors of a method, per class of self
+	if asyncio.iscoroutinefunction(f):
+		@functools.wraps(f)
+		async def wrapper(self, *args, **kwargs):
+			return await _steps(f(self, *args, **kwargs), get(type(self), f.__name__), f"{type(self).__name__}.{f.__name__}")
+	else:
+		@functools.wraps(f)
+		def wrapper(self, *args, **kwargs):
+			metric = get(type(self), f.__name__)
+			wall, cpu = time.perf_counter(), time.thread_time()
+			try:
+				return f(self, *args, **kwargs)
+			except Exception as e:
+				metric.error(e)
+				raise
+			finally:
+				end = time.perf_counter()
+				metric.add(end - wall, time.thread_time() - cpu)
+				if tracing.enabled:
+					tracing.complete(f"{type(self).__name__}.{f.__name__}", "update", wall, end, type(self).__name__)
+	return wrapper
+
+def gauge(name, f):
+	gauges[name] = f
+
+def snapshot():
+	widgets = {}
+	for (cls, name), metric in metrics.items():
+		widgets.setdefault(cls.__name__, {})[name] = metric.json()
+	return {
+		"widgets": widgets,
+		"gauges": {name: f() for name, f in gauges.items()},
+	}
+
+async def serve(path):
+	# Every connection gets a JSON snapshot, then the socket is closed
+	async def client(reader, writer):
+		writer.write(json.dumps(snapshot(), indent="\t").encode() + b"\n")
+		await writer.drain()
+		writer.close()
+	if os.path.exists(path):
+		os.unlink(path)
+	return await asyncio.start_unix_server(client, path)
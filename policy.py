@@ -0,0 +1,105 @@
+from gi.repository import GObject
+import asyncio
+import timer
+import util
+import xconn
+
+__all__ = ["policy", "watch_window", "watch_session"]
+
+# How much each condition stretches polling intervals; None pauses polling
+FACTORS = {
+	"battery": 2,
+	"idle": 4,
+	"hidden": None,
+	"blanked": None,
+}
+
+class Policy(GObject.Object):
+	@GObject.Signal
+	def changed(self): pass
+
+	def __init__(self):
+		super().__init__()
+		self.conditions = set()
+
+	@property
+	def scale(self):
+		scale = 1
+		for c in self.conditions:
+			f = FACTORS.get(c, 1)
+			if f is None: return None
+			scale *= f
+		return scale
+
+	def set(self, condition, active):
+		if active == (condition in self.conditions): return
+		if active:
+			self.conditions.add(condition)
+		else:
+			self.conditions.discard(condition)
+		self.emit("changed")
+
+	async def sleep(self, interval):
+		# Like asyncio.sleep, but stretched by the policy, and cut short on wakeup
+		changed = asyncio.Event()
+		handler = self.connect("changed", lambda _: changed.set())
+		try:
+			while True:
+				scale = self.scale
+				changed.clear()
+				try:
+					if scale is None:
+						await changed.wait()
+					else:
+						await asyncio.wait_for(changed.wait(), interval * scale)
+				except asyncio.TimeoutError:
+					return
+				new = self.scale
+				if new is not None and (scale is None or new < scale):
+					return
+		finally:
+			self.disconnect(handler)
+
+policy = Policy()
+policy.connect("changed", lambda p: timer.scheduler.set_scale(p.scale))
+
+mapped = set()
+
+def watch_window(win):
+	# Polling is paused once none of the watched windows are mapped
+	def update(visible):
+		if visible:
+			mapped.add(win)
+		else:
+			mapped.discard(win)
+		policy.set("hidden", not mapped)
+	win.connect("map-event", lambda *_: update(True))
+	win.connect("unmap-event", lambda *_: update(False))
+	win.connect("destroy", lambda *_: update(False))
+
+def watch_session(idle_after=300, interval=1):
+	from Xlib.ext import dpms
+	disp = xconn.get()
+	root = disp.screen().root
+	has_dpms = disp.has_extension("DPMS")
+	has_ss = disp.has_extension("MIT-SCREEN-SAVER")
+
+	def update():
+		blanked = False
+		idle = False
+		try:
+			if has_dpms:
+				info = disp.dpms_info()
+				blanked = bool(info.state) and info.power_level != dpms.DPMSModeOn
+			if has_ss:
+				info = root.screensaver_query_info()
+				blanked = blanked or info.state == 1 # ScreenSaverOn
+				idle = info.idle >= idle_after * 1000
+		except Exception as e:
+			util.print_exc(e)
+		policy.set("blanked", blanked)
+		policy.set("idle", idle)
+		return True
+
+	timer.every(interval, update, adaptive=False)
+	update()
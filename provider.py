@@ -0,0 +1,131 @@
+from gi.repository import GObject, GLib
+import asyncio
+import concurrent.futures
+import sys
+import timer
+
+__all__ = ["Provider", "shared", "prune"]
+
+replaying = False # Providers don't start their own sampling while a recording is replayed
+publish_hooks = [] # Called with (provider, key, value) on every publish
+
+class Provider(GObject.Object):
+	# Owns the sampling and IPC behind a widget, and publishes the results to
+	# any number of views, so several bars can share one backend
+	@GObject.Signal(arg_types=[str, object])
+	def changed(self, key, value): pass
+
+	def __init__(self):
+		super().__init__()
+		self.values = {}
+		self.timers = []
+		self.tasks = []
+		self.sources = []
+		self.watchers = 0
+		self.started = False
+		self.shared_key = None
+
+	@classmethod
+	def key(cls, *args, **kwargs):
+		return (args, tuple(sorted(kwargs.items())))
+
+	def start(self): pass
+
+	def close(self):
+		# Releases whatever start() opened besides timers, tasks and sources:
+		# bus connections, signal receivers, sockets
+		pass
+
+	def ensure_started(self):
+		if not self.started and not replaying:
+			self.started = True
+			self.start()
+
+	def stop(self):
+		if self.started:
+			self.close()
+		for t in self.timers: t.cancel()
+		for t in self.tasks: t.cancel()
+		for s in self.sources: GLib.source_remove(s)
+		self.timers = []
+		self.tasks = []
+		self.sources = []
+		self.started = False
+
+	def every(self, interval, callback, **kwargs):
+		t = timer.every(interval, callback, **kwargs)
+		self.timers.append(t)
+		return t
+
+	def spawn(self, coro):
+		task = asyncio.ensure_future(coro)
+		self.tasks.append(task)
+		return task
+
+	def connect_backend(self, name, connect, ready, timeout=5, backoff=(1, 60)):
+		# Runs the blocking connect() in a thread and ready(result) on the main
+		# loop, so a slow or missing service doesn't hold up the bar; failures
+		# and timeouts are retried with exponential backoff. A connect() that's
+		# still blocked can't be cancelled, so it gets its own thread, and no
+		# new attempt starts until it returns
+		async def run():
+			loop = asyncio.get_event_loop()
+			executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+			attempt = None
+			delay = backoff[0]
+			try:
+				while True:
+					if attempt is None or attempt.done():
+						attempt = loop.run_in_executor(executor, connect)
+					try:
+						ready(await asyncio.wait_for(asyncio.shield(attempt), timeout))
+						return
+					except Exception as e:
+						if isinstance(e, asyncio.TimeoutError):
+							e = f"no answer in {timeout} s"
+						print(f"{name}: {e}; retrying in {delay} s", file=sys.stderr)
+					await asyncio.sleep(delay)
+					delay = min(delay * 2, backoff[1])
+			finally:
+				executor.shutdown(wait=False)
+		return self.spawn(run())
+
+	def publish(self, key, value):
+		self.values[key] = value
+		for hook in publish_hooks:
+			hook(self, key, value)
+		self.emit("changed", key, value)
+
+	def watch(self, widget, key, f):
+		# Calls f with every value published under key until widget is destroyed
+		def changed(_, k, value):
+			if k == key: f(value)
+		handler = self.connect("changed", changed)
+		self.watchers += 1
+		def destroy(_):
+			self.disconnect(handler)
+			self.watchers -= 1
+			# Shared providers wait for prune(); one that was handed to its
+			# views directly has nothing else to stop it
+			if self.watchers == 0 and self.shared_key is None:
+				self.stop()
+		widget.connect("destroy", destroy)
+		self.ensure_started()
+		if key in self.values:
+			f(self.values[key])
+
+providers = {}
+
+def shared(cls, *args, **kwargs):
+	key = (cls, cls.key(*args, **kwargs))
+	if key not in providers:
+		providers[key] = cls(*args, **kwargs)
+		providers[key].shared_key = key
+	return providers[key]
+
+def prune():
+	# Stops and forgets the shared providers no view is watching any more
+	unused = [key for key, p in providers.items() if p.watchers == 0]
+	for key in unused:
+		providers.pop(key).stop()
+	return len(unused)
@@ -0,0 +1,82 @@
+import asyncio
+import pickle
+import sys
+import time
+import lanes
+import provider
+
+__all__ = ["record", "replay"]
+
+# A recording is a pickle stream of (seconds since start, provider key, key, value),
+# one per publish of a shared provider
+
+def picklable(value):
+	# Exceptions (like failed feeds) often carry unpicklable state, so they're
+	# flattened to their message
+	if isinstance(value, BaseException):
+		return RuntimeError(f"{type(value).__name__}: {value}")
+	if type(value) in (list, tuple):
+		return type(value)(picklable(v) for v in value)
+	if isinstance(value, tuple) and hasattr(value, "_fields"):
+		# A namedtuple takes its fields as separate arguments
+		return type(value)(*(picklable(v) for v in value))
+	return value
+
+class Recorder:
+	def __init__(self, path):
+		self.file = open(path, "wb")
+		self.t0 = time.monotonic()
+		self.count = 0
+
+	def __call__(self, p, key, value):
+		if p.shared_key is None: return
+		try:
+			data = pickle.dumps((time.monotonic() - self.t0, p.shared_key, key, picklable(value)))
+		except Exception as e:
+			print(f"record: skipping {type(p).__name__} {key}: {e}", file=sys.stderr)
+			return
+		self.file.write(data)
+		self.file.flush() # So a killed or crashed bar still leaves a usable recording
+		self.count += 1
+
+	def close(self):
+		self.file.close()
+		print(f"record: wrote {self.count} events", file=sys.stderr)
+
+def record(path):
+	recorder = Recorder(path)
+	provider.publish_hooks.append(recorder)
+	return recorder
+
+def load(path):
+	events = []
+	with open(path, "rb") as f:
+		while True:
+			try:
+				events.append(pickle.load(f))
+			except EOFError:
+				return events
+
+async def replay(path, speed=1, done=None):
+	# Publishes a recording through the bar's own shared providers; speed 0
+	# replays as fast as the main loop can take it
+	events = load(path)
+	missing = set()
+	start = time.monotonic()
+	for t, shared_key, key, value in events:
+		if speed:
+			delay = t / speed - (time.monotonic() - start)
+			if delay > 0:
+				await asyncio.sleep(delay)
+		else:
+			await lanes.idle() # Still let pending draws through
+		p = provider.providers.get(shared_key)
+		if p is None:
+			if shared_key not in missing:
+				missing.add(shared_key)
+				print(f"replay: no provider for {shared_key[0].__name__}{shared_key[1]}", file=sys.stderr)
+			continue
+		p.publish(key, value)
+	print(f"replay: {len(events)} events in {time.monotonic() - start:.2f} s", file=sys.stderr)
+	if done is not None:
+		done()
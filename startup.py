@@ -0,0 +1,68 @@
+import time
+import sys
+
+__all__ = ["enable", "span", "timed", "mark", "report", "report_on_first_frame"]
+
+t0 = time.perf_counter()
+enabled = False
+events = [] # (start, end, depth, name)
+depth = 0
+
+def enable():
+	global enabled
+	enabled = True
+
+class span:
+	def __init__(self, name):
+		self.name = name
+
+	def __enter__(self):
+		global depth
+		self.start = time.perf_counter()
+		self.depth = depth
+		depth += 1
+		return self
+
+	def __exit__(self, *exc):
+		global depth
+		depth -= 1
+		if enabled:
+			events.append((self.start, time.perf_counter(), self.depth, self.name))
+
+def timed(iterable, label):
+	# Times each step of a widget generator, i.e. each widget's construction
+	it = iter(iterable)
+	while True:
+		with span(label) as s:
+			try:
+				item = next(it)
+			except StopIteration:
+				s.name = f"{label} (end)"
+				return
+			s.name = f"{label}: {type(item).__name__}"
+		yield item
+
+def mark(name):
+	if enabled:
+		now = time.perf_counter()
+		events.append((now, now, depth, name))
+
+def report(file=None):
+	file = file or sys.stderr
+	print("startup profile (start, duration):", file=file)
+	for start, end, depth, name in sorted(events, key=lambda e: (e[0], e[2])):
+		print(f"{(start-t0)*1000:8.1f} ms {(end-start)*1000:8.1f} ms  {'  '*depth}{name}", file=file)
+
+def report_on_first_frame(win):
+	if not enabled: return
+	def map_event(win, _):
+		win.disconnect(map_handler)
+		mark("first map")
+	map_handler = win.connect("map-event", map_event)
+
+	clock = win.get_frame_clock()
+	def after_paint(clock):
+		clock.disconnect(handler)
+		mark("first frame")
+		report()
+	handler = clock.connect("after-paint", after_paint)
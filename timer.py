@@ -0,0 +1,111 @@
+from gi.repository import GLib
+import math
+import time
+import util
+import lanes
+
+__all__ = ["every", "Scheduler"]
+
+SLACK = 0.005 # Timers due this close to the wakeup are fired in the same batch
+JUMP = 1 # Seconds the wall clock may drift from the monotonic clock between ticks before it counts as set
+
+class Timer:
+	def __init__(self, scheduler, interval, callback, phase, priority, adaptive):
+		self.scheduler = scheduler
+		self.interval = interval
+		self.callback = callback
+		self.phase = phase
+		self.priority = priority
+		self.adaptive = adaptive
+		self.due = self.next(time.time())
+
+	def next(self, now):
+		interval = self.interval
+		if self.adaptive:
+			if self.scheduler.scale is None: return None
+			interval *= self.scheduler.scale
+		# Next wall clock multiple of the interval, offset by the phase
+		n = math.floor((now - self.phase) / interval) + 1
+		return n * interval + self.phase
+
+	def cancel(self):
+		self.scheduler.remove(self)
+
+class Scheduler:
+	def __init__(self):
+		self.timers = []
+		self.source = None
+		self.wakeup = None
+		self.scale = 1
+		self.clock = None # (wall, monotonic) time of the last tick
+
+	def add(self, interval, callback, phase=0, priority=0, adaptive=True):
+		timer = Timer(self, interval, callback, phase, priority, adaptive)
+		self.timers.append(timer)
+		self.reschedule()
+		return timer
+
+	def remove(self, timer):
+		if timer in self.timers:
+			self.timers.remove(timer)
+			self.reschedule()
+
+	def set_scale(self, scale):
+		# Multiplies the interval of adaptive timers; None pauses them
+		old, self.scale = self.scale, scale
+		now = time.time()
+		for t in self.timers:
+			if not t.adaptive: continue
+			if scale is not None and (old is None or scale < old):
+				t.due = now # Waking up, so sample right away
+			else:
+				t.due = t.next(now)
+		self.reschedule()
+
+	def reschedule(self):
+		due = min((t.due for t in self.timers if t.due is not None), default=None)
+		if due == self.wakeup: return
+		if self.source is not None:
+			GLib.source_remove(self.source)
+			self.source = None
+		self.wakeup = due
+		if due is not None:
+			delay = max(0, math.ceil((due - time.time()) * 1000))
+			self.source = GLib.timeout_add(delay, self.fire, priority=lanes.BACKGROUND)
+
+	def check_clock(self, now):
+		# Due times are on the wall clock, so if it's been stepped (NTP, resume,
+		# by hand) they're realigned to it; otherwise a step back would hold
+		# every timer until the clock caught up again
+		mono = GLib.get_monotonic_time() / 1e6
+		if self.clock is not None:
+			wall, then = self.clock
+			if abs((now - wall) - (mono - then)) > JUMP:
+				for t in self.timers:
+					if t.due is not None:
+						t.due = t.next(now)
+		self.clock = (now, mono)
+
+	def fire(self):
+		self.source = None
+		self.wakeup = None
+		now = time.time()
+		self.check_clock(now)
+		# Lower priority values go first, like GLib's
+		batch = sorted((t for t in self.timers if t.due is not None and t.due <= now + SLACK), key=lambda t: t.priority)
+		for t in batch:
+			if t not in self.timers: continue # Cancelled by an earlier callback
+			try:
+				keep = t.callback()
+			except Exception as e:
+				util.print_exc(e)
+				keep = True
+			if keep:
+				t.due = t.next(max(now, t.due) + SLACK)
+			else:
+				self.timers.remove(t)
+		self.reschedule()
+		return False
+
+scheduler = Scheduler()
+every = scheduler.add
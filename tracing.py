@@ -0,0 +1,168 @@
+from gi.repository import GLib
+import asyncio
+import collections
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+__all__ = ["enable", "span", "complete", "watch_window", "watch_widget", "save"]
+
+LIMIT = 200000 # Only the most recent events are kept
+
+t0 = time.perf_counter()
+enabled = False
+events = collections.deque(maxlen=LIMIT)
+pid = os.getpid()
+ids = iter(range(1, sys.maxsize))
+
+def us(t):
+	return (t - t0) * 1e6
+
+def owner(f):
+	# The widget or provider class a callback belongs to, if any
+	obj = getattr(f, "__self__", None)
+	if obj is None:
+		frame = getattr(f, "cr_frame", None) or getattr(f, "gi_frame", None)
+		obj = frame and frame.f_locals.get("self")
+	return type(obj).__name__ if obj is not None else None
+
+def complete(name, cat, start, end, widget=None):
+	args = {"widget": widget} if widget else {}
+	events.append({"name": name, "cat": cat, "ph": "X", "ts": us(start), "dur": us(end) - us(start),
+		"pid": pid, "tid": threading.get_ident(), "args": args})
+
+def instant(name, cat):
+	events.append({"name": name, "cat": cat, "ph": "i", "s": "p", "ts": us(time.perf_counter()),
+		"pid": pid, "tid": threading.get_ident()})
+
+def async_event(ph, id, name, cat, widget=None):
+	events.append({"name": name, "cat": cat, "ph": ph, "id": id, "ts": us(time.perf_counter()),
+		"pid": pid, "tid": threading.get_ident(), "args": {"widget": widget} if widget else {}})
+
+class span:
+	def __init__(self, name, cat, widget=None):
+		self.name = name
+		self.cat = cat
+		self.widget = widget
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, *exc):
+		if enabled:
+			complete(self.name, self.cat, self.start, time.perf_counter(), self.widget)
+
+def wrap_source(f):
+	name = getattr(f, "__qualname__", repr(f))
+	widget = owner(f)
+	@functools.wraps(f)
+	def dispatch(*args):
+		with span(name, "source", widget):
+			return f(*args)
+	return dispatch
+
+def patch_sources():
+	# Every GLib source added from Python from now on is traced when dispatched
+	def patch(add):
+		@functools.wraps(add)
+		def traced(*args, **kwargs):
+			args = list(args)
+			for i, a in enumerate(args):
+				if callable(a):
+					args[i] = wrap_source(a)
+					break
+			return add(*args, **kwargs)
+		return traced
+	for name in ["idle_add", "timeout_add", "timeout_add_seconds", "io_add_watch"]:
+		setattr(GLib, name, patch(getattr(GLib, name)))
+
+class Steps:
+	# Drives coro on behalf of an await, recording each step as a span
+	def __init__(self, coro, name, widget):
+		self.coro = coro
+		self.name = name
+		self.widget = widget
+
+	def __await__(self):
+		return self
+
+	def __iter__(self):
+		return self
+
+	def __next__(self):
+		return self.send(None)
+
+	def send(self, value):
+		return self.step(self.coro.send, value)
+
+	def throw(self, *exc):
+		return self.step(self.coro.throw, *exc)
+
+	def close(self):
+		self.coro.close()
+
+	def step(self, f, *args):
+		start = time.perf_counter()
+		try:
+			return f(*args)
+		finally:
+			complete(self.name, "step", start, time.perf_counter(), self.widget)
+
+async def task_steps(coro, name, widget):
+	# Records every step of a task, and the task's whole lifetime as an async span
+	id = next(ids)
+	async_event("b", id, name, "task", widget)
+	try:
+		return await Steps(coro, name, widget)
+	finally:
+		async_event("e", id, name, "task", widget)
+
+def task_factory(loop, coro, **kwargs):
+	name = getattr(coro, "__qualname__", repr(coro))
+	wrapper = task_steps(coro, name, owner(coro))
+	# Tasks keep the name of what they run, for the watchdog and for debugging
+	wrapper.__name__ = getattr(coro, "__name__", name)
+	wrapper.__qualname__ = name
+	return asyncio.Task(wrapper, loop=loop, **kwargs)
+
+def watch_window(win):
+	# Spans for the layout and paint phases of every frame of win
+	clock = win.get_frame_clock()
+	phases = {}
+	def begin(phase):
+		def f(_): phases[phase] = time.perf_counter()
+		return f
+	def end(phase):
+		def f(_):
+			if phase in phases:
+				complete(phase, "frame", phases.pop(phase), time.perf_counter(), type(win).__name__)
+		return f
+	clock.connect("layout", begin("layout"))
+	clock.connect("paint", end("layout"))
+	clock.connect("paint", begin("paint"))
+	clock.connect("after-paint", end("paint"))
+
+def watch_widget(widget):
+	# Spans for GTK's own drawing of widget, including its draw handlers
+	start = []
+	def begin(*_): start.append(time.perf_counter())
+	def end(*_):
+		if start:
+			complete("draw", "draw", start.pop(), time.perf_counter(), type(widget).__name__)
+	widget.connect("draw", begin)
+	widget.connect_after("draw", end)
+
+def enable():
+	global enabled
+	enabled = True
+	patch_sources()
+	asyncio.get_event_loop().set_task_factory(task_factory)
+
+def save(path):
+	with open(path, "w") as f:
+		json.dump({"traceEvents": list(events), "displayTimeUnit": "ms"}, f)
+	print(f"trace: wrote {len(events)} events to {path}", file=sys.stderr)
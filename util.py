@@ -1,6 +1,7 @@
-from gi.repository import Gtk, Gdk, Pango
+from gi.repository import Gtk, Gdk, GLib, Pango
+import time
 
-__all__ = ["symbol", "get_height", "popupify", "make_popup", "framed", "scrollable"]
+__all__ = ["symbol", "get_height", "style_cache", "stable_width", "Tooltip", "popupify", "make_popup", "Popup", "framed", "scrollable"]
 
 def symbol(symbols, f):
 	if f <= 0: return symbols[0]
@@ -14,10 +15,158 @@ def safely(f, default=None):
 		return default
 
 def get_height(self):
-	pango = self.get_pango_context()
-	layout = Pango.Layout(pango)
-	layout.set_text("|", 1)
-	return layout.get_pixel_extents()[1].height
+	return style_cache(self).font_height()
+
+class StyleCache:
+	# What custom drawing needs from a widget's style (colour, font metrics,
+	# text layouts), resolved once and kept until the style, state or screen
+	# changes, so an ordinary frame does no CSS lookups or Pango shaping
+	def __init__(self, widget):
+		self.widget = widget
+		self.values = {}
+		widget.connect("style-updated", self.clear)
+		widget.connect("state-flags-changed", self.clear)
+		widget.connect("screen-changed", self.clear)
+
+	def clear(self, *_):
+		self.values = {}
+
+	def get(self, key, compute):
+		if key not in self.values:
+			self.values[key] = compute()
+		return self.values[key]
+
+	def color(self):
+		def compute():
+			style = self.widget.get_style_context()
+			return style.get_color(style.get_state())
+		return self.get("color", compute)
+
+	def font_metrics(self):
+		return self.get("metrics", lambda: self.widget.get_pango_context().get_metrics())
+
+	def layout(self, text):
+		# A single layout per widget, only reshaped when asked for other text
+		layout = self.get("layout", lambda: Pango.Layout.new(self.widget.get_pango_context()))
+		if layout.get_text() != text:
+			layout.set_text(text, -1)
+		return layout
+
+	def font_height(self):
+		return self.get("height", lambda: self.layout("|").get_pixel_extents()[1].height)
+
+def style_cache(widget):
+	cache = getattr(widget, "style_cache", None)
+	if cache is None:
+		cache = widget.style_cache = StyleCache(widget)
+	return cache
+
+class StableWidth:
+	# Keeps a label from changing width on every update, which would reallocate
+	# the whole bar: digits are tabular, and the widest text seen is reserved
+	# until the label has been narrower for shrink_after seconds
+	def __init__(self, label, shrink_after):
+		self.label = label
+		self.shrink_after = shrink_after
+		self.reserved = 0
+		self.shrink_source = None
+
+		attrs = Pango.AttrList()
+		attrs.insert(Pango.attr_font_features_new("tnum"))
+		label.set_attributes(attrs)
+
+		label.connect("notify::label", self.update)
+		label.connect("style-updated", self.reset)
+		label.connect("destroy", lambda _: self.cancel_shrink())
+
+	def width(self):
+		return self.label.get_layout().get_pixel_size()[0]
+
+	def update(self, *_):
+		width = self.width()
+		if width >= self.reserved:
+			self.cancel_shrink()
+			if width > self.reserved:
+				self.reserve(width)
+		elif self.shrink_source is None:
+			self.shrink_source = GLib.timeout_add_seconds(self.shrink_after, self.shrink)
+
+	def reserve(self, width):
+		self.reserved = width
+		self.label.set_size_request(width, -1)
+
+	def shrink(self):
+		self.shrink_source = None
+		self.reserve(self.width())
+		return False
+
+	def cancel_shrink(self):
+		if self.shrink_source is not None:
+			GLib.source_remove(self.shrink_source)
+			self.shrink_source = None
+
+	def reset(self, *_):
+		# A new font makes the old reservation meaningless
+		self.cancel_shrink()
+		self.reserved = 0
+		self.label.set_size_request(-1, -1)
+		self.update()
+
+def stable_width(label, shrink_after=10):
+	label.stable_width = StableWidth(label, shrink_after)
+	return label
+
+class Tooltip:
+	# Tooltip content is only computed while the tooltip is showing. build()
+	# makes the widget tree once, on the first hover, and fill(tree, data)
+	# updates it (returning False hides the tooltip); data comes from fetch(),
+	# which is called at most once per ttl seconds
+	def __init__(self, widget, build, fill, fetch=lambda: None, ttl=1):
+		self.widget = widget
+		self.build = build
+		self.fill = fill
+		self.fetch = fetch
+		self.ttl = ttl
+		self.tree = None
+		self.data = None
+		self.fetched = None
+		self.visible = False
+		widget.connect("query-tooltip", self.query)
+		widget.set_has_tooltip(True)
+
+	def get_data(self):
+		now = time.monotonic()
+		if self.fetched is None or now - self.fetched >= self.ttl:
+			self.data = self.fetch()
+			self.fetched = now
+		return self.data
+
+	def query(self, widget, x, y, keyboard, tooltip):
+		if self.tree is None:
+			self.tree = self.build()
+			self.tree.connect("map", lambda _: setattr(self, "visible", True))
+			self.tree.connect("unmap", lambda _: setattr(self, "visible", False))
+		if self.fill(self.tree, self.get_data()) is False:
+			return False
+		self.tree.show_all()
+		tooltip.set_custom(self.tree)
+		return True
+
+	def changed(self):
+		# New data; only matters if someone's looking
+		self.fetched = None
+		if self.visible:
+			self.widget.trigger_tooltip_query()
+
+def rows(labels):
+	# A two column grid of labels; the right hand ones are in grid.values
+	grid = Gtk.Grid()
+	grid.values = []
+	for n, l in enumerate(labels):
+		grid.attach(Gtk.Label(l, xalign=0), 0, n, 1, 1)
+		grid.values.append(Gtk.Label(xalign=1))
+		grid.attach(grid.values[-1], 1, n, 1, 1)
+	return grid
 
 def popupify(win, parent):
 	win.set_decorated(False)
@@ -63,6 +212,48 @@ def make_popup(widget, parent):
 		win.add(widget)
 	return win
 
+class Popup:
+	# A popup that's built on first use and then just hidden and shown again;
+	# refresh() brings its content up to date each time it opens
+	def __init__(self, parent, build, refresh=None):
+		self.parent = parent
+		self.build = build
+		self.refresh_content = refresh
+		self.win = None
+		def destroy(_):
+			if self.win is not None:
+				self.win.destroy()
+		parent.connect("destroy", destroy)
+
+	def get_window(self):
+		if self.win is None:
+			self.win = make_popup(self.build(), self.parent)
+		return self.win
+
+	def is_visible(self):
+		return self.win is not None and self.win.is_visible()
+
+	def show(self):
+		win = self.get_window()
+		if self.refresh_content is not None:
+			self.refresh_content()
+		win.show_all()
+
+	def hide(self):
+		if self.win is not None:
+			self.win.hide()
+
+	def toggle(self):
+		if self.is_visible():
+			self.hide()
+		else:
+			self.show()
+
+	def refresh(self):
+		# For new data; a hidden popup catches up when it's next shown
+		if self.is_visible() and self.refresh_content is not None:
+			self.refresh_content()
+
 def framed(widget):
 	frame = Gtk.Frame()
 	frame.add(widget)
@@ -0,0 +1,59 @@
+from gi.repository import Gtk, GLib
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from provider import Provider
+
+__all__ = ["Watchdog"]
+
+class Watchdog:
+	# A heartbeat on the main loop, and a thread that reports whatever the main
+	# thread is doing if the heartbeat is late by more than the budget
+	def __init__(self, budget):
+		self.budget = budget
+		self.interval = budget / 2 # Between beats the loop is idle, not blocked
+		self.beat = time.monotonic()
+		self.stall = None
+		self.main = threading.main_thread().ident
+		self.loop = asyncio.get_event_loop()
+
+	def start(self):
+		GLib.timeout_add(max(1, int(self.interval * 1000)), self.heartbeat, priority=GLib.PRIORITY_HIGH)
+		threading.Thread(target=self.watch, name="watchdog", daemon=True).start()
+
+	def heartbeat(self):
+		now = time.monotonic()
+		if self.stall is not None:
+			print(f"stall: main loop was blocked for {(now - self.beat - self.interval)*1000:.0f} ms in {self.stall}", file=sys.stderr)
+			self.stall = None
+		self.beat = now
+		return True
+
+	def watch(self):
+		while True:
+			time.sleep(self.budget / 4)
+			if self.stall is None and time.monotonic() - self.beat > self.budget + self.interval:
+				frame = sys._current_frames().get(self.main)
+				if frame is None: continue
+				self.stall = self.culprit(frame)
+				print(f"stall: main loop blocked for more than {self.budget*1000:.0f} ms in {self.stall}", file=sys.stderr)
+				traceback.print_stack(frame, file=sys.stderr)
+
+	def culprit(self, frame):
+		where = None
+		f = frame
+		while f is not None:
+			obj = f.f_locals.get("self")
+			if isinstance(obj, (Gtk.Widget, Provider)):
+				where = f"{type(obj).__name__}.{f.f_code.co_name}"
+				break
+			f = f.f_back
+		if where is None:
+			where = f"{frame.f_code.co_filename}:{frame.f_lineno} ({frame.f_code.co_name})"
+
+		task = asyncio.current_task(self.loop)
+		if task is not None:
+			where += f" [task {task.get_coro().__qualname__}]"
+		return where
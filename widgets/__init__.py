@@ -1,24 +1,42 @@
-try: from .separator import *
-except ImportError as e: print("separator:", e)
-try: from .clock import *
-except ImportError as e: print("clock:", e)
-try: from .battery import *
-except ImportError as e: print("battery:", e)
-try: from .temperature import *
-except ImportError as e: print("temperature:", e)
-try: from .wifi import *
-except ImportError as e: print("wifi:", e)
-try: from .ram import *
-except ImportError as e: print("ram:", e)
-try: from .cpugraph import *
-except ImportError as e: print("cpugraph:", e)
-try: from .volume_pulse import *
-except ImportError as e: print("volume_pulse:", e)
-try: from .volume_alsa import *
-except ImportError as e: print("volume_alsa:", e)
-try: from .feed import *
-except ImportError as e: print("feed:", e)
-try: from .ibus import *
-except ImportError as e: print("ibus:", e)
-try: from .mpd import *
-except ImportError as e: print("mpd:", e)
+import importlib
+import startup
+
+# Widget name -> module. Modules (and the libraries and typelibs they pull in)
+# are only imported once the config actually uses something from them.
+registry = {
+	"Separator": "separator",
+	"Clock": "clock",
+	"Battery": "battery",
+	"Temperature": "temperature",
+	"Wifi": "wifi",
+	"RAM": "ram",
+	"CPUGraph": "cpugraph",
+	"Volume": "volume_pulse",
+	"AlsaVolume": "volume_alsa",
+	"Feeds": "feed",
+	"Feed": "feed",
+	"RSSFeed": "feed",
+	"FFNFeed": "feed",
+	"Firefox": "feed",
+	"Luakit": "feed",
+	"IBus": "ibus",
+	"MPD2": "mpd",
+}
+
+__all__ = list(registry)
+
+def __getattr__(name):
+	if name not in registry:
+		raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+	try:
+		with startup.span(f"import {__name__}.{registry[name]}"):
+			module = importlib.import_module("." + registry[name], __name__)
+	except ImportError as e:
+		print(f"{registry[name]}:", e)
+		raise
+	value = getattr(module, name)
+	globals()[name] = value
+	return value
+
+def __dir__():
+	return sorted(set(globals()) | set(__all__))
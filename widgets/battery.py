@@ -1,11 +1,39 @@
-from gi.repository import Gtk, GLib
+from gi.repository import Gtk
 import os.path
 import time
 import cairo
 import simplebat
+import util
+import frame
+from types import SimpleNamespace
+from policy import policy
+from provider import Provider, shared
+import metrics
 
 __all__ = ["Battery"]
 
+FIELDS = ["status", "energy_now", "energy_full", "energy_design", "current", "voltage_now", "voltage_design", "remaining"]
+
+class BatteryProvider(Provider):
+	def __init__(self, path):
+		super().__init__()
+		self.path = path
+
+	def start(self):
+		self.every(1, self.update)
+		self.update()
+
+	@metrics.timed
+	def update(self):
+		if os.path.exists(self.path):
+			bat = simplebat.BatteryStatus(self.path)
+			bat = SimpleNamespace(**{k: getattr(bat, k) for k in FIELDS})
+		else:
+			bat = None
+		policy.set("battery", bat is not None and bat.status == "Discharging")
+		self.publish("status", bat)
+		return True
+
 class Battery(Gtk.EventBox):
 	def __init__(self, path, verbose=0, spacing=3):
 		super().__init__()
@@ -14,52 +42,34 @@ class Battery(Gtk.EventBox):
 
 		self.icon = BatteryIcon()
 		self.text = Gtk.Label()
+		util.stable_width(self.text)
 		box = Gtk.Box(spacing=spacing)
 		box.pack_start(self.icon, False, False, 0)
 		box.pack_start(self.text, False, False, 0)
 		self.add(box)
 
-		self.tooltip = Gtk.Grid()
-		n = 0
-		def row(l):
-			nonlocal n
-			left = Gtk.Label(l, xalign=0)
-			right = Gtk.Label(xalign=1)
-			self.tooltip.attach(left, 0, n, 1, 1)
-			self.tooltip.attach(right, 1, n, 1, 1)
-			n += 1
-			return right
-		self.tt_status = row("Status")
-		self.tt_energy = row("Energy")
-		self.tt_current = row("Current")
-		self.tt_voltage = row("Voltage")
-		self.tt_capacity = row("Capacity")
-		self.tooltip.show_all()
-		self.set_has_tooltip(True)
-
-		def tooltip(self, x, y, keyboard, tooltip):
-			tooltip.set_custom(self.tooltip)
-			return True
-		self.connect("query-tooltip", tooltip)
-
-		GLib.timeout_add_seconds(1, self.update)
-		self.update()
-
-	def update(self):
-		if os.path.exists(self.path):
-			self.show()
-		else:
-			self.hide()
-			return True
-
-		bat = simplebat.BatteryStatus(self.path)
-
-		self.tt_status.set_text(bat.status)
-		self.tt_energy.set_text(f"{bat.energy_now}/{bat.energy_full} Wh ({bat.energy_now/bat.energy_full*100:.1f}%)")
-		self.tt_current.set_text(f"{bat.current:+} W")
-
-		self.tt_voltage.set_text(f"{bat.voltage_now}/{bat.voltage_design} V ({(bat.voltage_now/bat.voltage_design-1)*100:+.1f}%)")
-		self.tt_capacity.set_text(f"{bat.energy_full}/{bat.energy_design} Wh ({bat.energy_full/bat.energy_design*100:.1f}%)")
+		self.provider = shared(BatteryProvider, path)
+		self.tooltip = util.Tooltip(self,
+			lambda: util.rows(["Status", "Energy", "Current", "Voltage", "Capacity"]),
+			self.fill_tooltip,
+			lambda: self.provider.values.get("status"))
+		self.provider.watch(self, "status", self.update)
+
+	def fill_tooltip(self, tree, bat):
+		if bat is None: return False
+		status, energy, current, voltage, capacity = tree.values
+		status.set_text(bat.status)
+		energy.set_text(f"{bat.energy_now}/{bat.energy_full} Wh ({bat.energy_now/bat.energy_full*100:.1f}%)")
+		current.set_text(f"{bat.current:+} W")
+		voltage.set_text(f"{bat.voltage_now}/{bat.voltage_design} V ({(bat.voltage_now/bat.voltage_design-1)*100:+.1f}%)")
+		capacity.set_text(f"{bat.energy_full}/{bat.energy_design} Wh ({bat.energy_full/bat.energy_design*100:.1f}%)")
+
+	@metrics.timed
+	def update(self, bat):
+		frame.set_visible(self, bat is not None)
+		self.tooltip.changed()
+		if bat is None:
+			return
 
 		charge = bat.energy_now / bat.energy_full
 		self.icon.set_value(charge)
@@ -73,28 +83,35 @@ class Battery(Gtk.EventBox):
 				text += " {}{:.2f}W ({})".format(symbol, abs(bat.current), remainingTime)
 			elif self.verbose > 1:
 				text += "  -.--W (--:--)"
-		self.text.set_text(text)
-
-		return True
+		frame.set_text(self.text, text)
 
 class BatteryIcon(Gtk.DrawingArea):
 	def __init__(self):
 		super().__init__()
+		self.style_cache = util.style_cache(self)
+		self.connect("style-updated", self.update_size)
+		self.update_size()
 		self.set_value(0)
 
+	def font_size(self):
+		font_metrics = self.style_cache.font_metrics()
+		return (font_metrics.get_ascent() - font_metrics.get_descent()) / 1024
+
+	def update_size(self, *_):
+		fontsize = self.font_size()
+		t = max(1, int(fontsize/10))
+		self.set_size_request(int(fontsize * 1.7) + t, int(fontsize))
+
 	def set_value(self, v):
 		self.value = v
-		self.queue_draw()
+		frame.queue_draw(self)
 
+	@metrics.timed
 	def do_draw(self, ctx):
 		ctx.set_fill_rule(cairo.FILL_RULE_EVEN_ODD)
-		style = self.get_style_context()
-		r, g, b, a = style.get_color(style.get_state())
-		ctx.set_source_rgba(r, g, b, a)
+		ctx.set_source_rgba(*self.style_cache.color())
 
-		pango = self.get_pango_context()
-		metrics = pango.get_metrics()
-		fontsize = (metrics.get_ascent() - metrics.get_descent()) / 1024
+		fontsize = self.font_size()
 		pos = (self.get_allocated_height() - fontsize) // 2
 		ctx.translate(0, pos)
 
@@ -107,7 +124,6 @@ class BatteryIcon(Gtk.DrawingArea):
 		t = max(1, int(fontsize/10))
 		h = int(fontsize)
 		w = int(fontsize * 1.7) # Doesn't include the nub
-		self.set_size_request(w+t, h)
 
 		T = t*2
 		W = (w-T*2+0.25)*min(self.value, 1)
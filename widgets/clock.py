@@ -1,9 +1,22 @@
-from gi.repository import Gtk, Gdk, GLib
+from gi.repository import Gtk, Gdk
 import util
+import frame
 import time
+from provider import Provider, shared
+import metrics
 
 __all__ = ["Clock"]
 
+class ClockProvider(Provider):
+	def start(self):
+		self.every(1, self.update, adaptive=False) # Stretched ticks would make the seconds jump
+		self.update()
+
+	@metrics.timed
+	def update(self):
+		self.publish("time", time.time())
+		return True
+
 class Clock(Gtk.EventBox):
 	def __init__(self, format="%T"):
 		super().__init__()
@@ -11,6 +24,7 @@ class Clock(Gtk.EventBox):
 
 		box = Gtk.Box()
 		self.text = Gtk.Label()
+		util.stable_width(self.text)
 		box.pack_start(self.text, False, False, 0)
 		self.add(box)
 
@@ -18,19 +32,27 @@ class Clock(Gtk.EventBox):
 		box.show()
 		self.show()
 
-		GLib.timeout_add_seconds(1, self.update)
-		self.update()
+		shared(ClockProvider).watch(self, "time", self.update)
 
+		self.popup = util.Popup(self, self.build_popup, self.refresh_popup)
 		self.set_events(Gdk.EventMask.BUTTON_PRESS_MASK)
 		self.connect("button-press-event", self.click)
 
-	def update(self):
-		self.text.set_text(time.strftime(self.format, time.localtime(round(time.time()))))
-		return True
+	@metrics.timed
+	def update(self, now):
+		frame.set_text(self.text, time.strftime(self.format, time.localtime(round(now))))
+
+	def build_popup(self):
+		self.calendar = Gtk.Calendar()
+		self.calendar.set_display_options(Gtk.CalendarDisplayOptions.SHOW_WEEK_NUMBERS | Gtk.CalendarDisplayOptions.SHOW_DAY_NAMES | Gtk.CalendarDisplayOptions.SHOW_HEADING)
+		return self.calendar
+
+	def refresh_popup(self):
+		# Back to today, as a new calendar would be
+		today = time.localtime()
+		self.calendar.select_month(today.tm_mon - 1, today.tm_year)
+		self.calendar.select_day(today.tm_mday)
 
 	def click(self, _, evt):
 		if (evt.button, evt.type) == (1, Gdk.EventType.BUTTON_PRESS):
-			cal = Gtk.Calendar()
-			cal.set_display_options(Gtk.CalendarDisplayOptions.SHOW_WEEK_NUMBERS | Gtk.CalendarDisplayOptions.SHOW_DAY_NAMES | Gtk.CalendarDisplayOptions.SHOW_HEADING)
-			self.popup = util.make_popup(cal, self)
-			self.popup.show_all()
+			self.popup.show()
@@ -1,49 +1,81 @@
-from gi.repository import Gtk, GLib
+from gi.repository import Gtk
 import cairo
 import util
+import frame
+from provider import Provider, shared
+import metrics
 
-from collections import namedtuple
+from collections import namedtuple, deque
 Sample = namedtuple("Sample", "user system iowait")
 
 __all__ = ["CPUGraph"]
 
-class CPUGraph(Gtk.DrawingArea):
-	def __init__(self, width=50, interval=100):
+class CPUProvider(Provider):
+	def __init__(self, interval):
 		super().__init__()
+		self.interval = interval
 		self.last_cpu = None
-		self.samples = [Sample(0, 0, 0)] * width
-		self.cores = 1
+		self.history = deque(maxlen=1)
 
-		GLib.timeout_add(interval, self.update)
-		self.connect("draw", self.draw)
-		self.set_size_request(width, 0)
+	def want(self, length):
+		if length > self.history.maxlen:
+			self.history = deque(self.history, maxlen=length)
+
+	def start(self):
+		self.every(self.interval / 1000, self.update)
 
+	@metrics.timed
 	def update(self):
 		import psutil
 		cpu = psutil.cpu_times()
-		self.cores = psutil.cpu_count()
+		cores = psutil.cpu_count()
+		if cores != self.values.get("cores"):
+			self.publish("cores", cores)
 		if self.last_cpu:
 			tot = (psutil._cpu_tot_time(cpu) - psutil._cpu_tot_time(self.last_cpu)) or 1e10 # Sometimes zero, so set it to something huge
-			self.samples.pop(0)
-			self.samples.append(Sample(
+			self.history.append(Sample(
 				(cpu.user - self.last_cpu.user) / tot,
 				(cpu.system - self.last_cpu.system) / tot,
 				(cpu.iowait - self.last_cpu.iowait) / tot,
 			))
+			self.publish("samples", tuple(self.history))
 		self.last_cpu = cpu
-		self.queue_draw()
 		return True
 
+class CPUGraph(Gtk.DrawingArea):
+	def __init__(self, width=50, interval=100):
+		super().__init__()
+		self.width = width
+		self.samples = [Sample(0, 0, 0)] * width
+		self.cores = 1
+
+		provider = shared(CPUProvider, interval)
+		provider.want(width)
+		provider.watch(self, "cores", self.set_cores)
+		provider.watch(self, "samples", self.update)
+		self.connect("draw", self.draw)
+		self.set_size_request(width, 0)
+
+	def set_cores(self, cores):
+		self.cores = cores
+
+	@metrics.timed
+	def update(self, samples):
+		samples = samples[-self.width:]
+		self.samples = [Sample(0, 0, 0)] * (self.width - len(samples)) + list(samples)
+		frame.queue_draw(self)
+
+	@metrics.timed
 	def draw(self, _, ctx):
 		ctx.set_antialias(cairo.ANTIALIAS_NONE)
 		ctx.set_line_width(1)
 		ctx.set_line_join(cairo.LINE_JOIN_BEVEL)
 		ctx.set_line_cap(cairo.LINE_CAP_BUTT)
 
-		style = self.get_style_context()
-		r, g, b, a = style.get_color(style.get_state())
+		cache = util.style_cache(self)
+		r, g, b, a = cache.color()
 
-		font_height = util.get_height(self)
+		font_height = cache.font_height()
 		height = self.get_allocated_height()
 		ctx.translate(0, (height - font_height) // 2 + 1)
 
@@ -1,5 +1,9 @@
 from gi.repository import Gtk, Gdk
 import util
+import frame
+import lanes
+from provider import Provider, shared
+import metrics
 import subprocess
 import asyncio
 import aiohttp
@@ -7,11 +11,16 @@ import aiosqlite
 
 import configparser
 from pathlib import Path
-import bs4
 
-icon = Gtk.IconTheme.get_default().load_icon("application-rss+xml", 16, 0)
-iconGray = icon.copy()
-iconGray.saturate_and_pixelate(iconGray, 0, False)
+icons = None
+def get_icons():
+	global icons
+	if icons is None:
+		icon = Gtk.IconTheme.get_default().load_icon("application-rss+xml", 16, 0)
+		iconGray = icon.copy()
+		iconGray.saturate_and_pixelate(iconGray, 0, False)
+		icons = (icon, iconGray)
+	return icons
 
 def clean_url(url):
 	from urllib.parse import urlparse, urlunparse
@@ -24,12 +33,74 @@ def clean_all_urls(feed):
 
 browser = lambda _, url: subprocess.Popen(["xdg-open", url])
 
+class FeedsProvider(Provider):
+	def __init__(self, hist, feeds):
+		super().__init__()
+		(self.sql_path, self.sql_query) = hist
+		self.feeds = feeds
+		self.urls = set()
+
+		self.event_fetch = asyncio.Event()
+		self.event_hist = asyncio.Event()
+
+	@classmethod
+	def key(cls, hist, feeds):
+		return (tuple(hist), tuple((type(feed), feed.name, feed.url) for feed in feeds))
+
+	def start(self):
+		self.spawn(self.run())
+		self.spawn(self.update_hist())
+
+	def fetch(self):
+		self.event_fetch.set()
+
+	async def run(self):
+		async with aiohttp.ClientSession() as session:
+			while True:
+				await self.fetch_all(session)
+				self.event_hist.set()
+				await asyncio.wait([self.event_fetch.wait()], timeout=60*60)
+				self.event_fetch.clear()
+
+	@metrics.timed
+	async def fetch_all(self, session):
+		async def load_feed(feed):
+			async with session.get(feed.url) as response:
+				return clean_all_urls(feed(await response.read()))
+
+		feeds = await asyncio.gather(*(load_feed(feed) for feed in self.feeds), return_exceptions=True)
+		for feed in feeds:
+			if isinstance(feed, BaseException):
+				util.print_exc(feed)
+		self.urls = {url for feed in feeds if not isinstance(feed, BaseException) for (_, url) in feed[2]}
+		self.publish("feeds", feeds)
+
+	async def update_hist(self):
+		async with aiosqlite.connect(self.sql_path) as db:
+			while True:
+				await self.check_history(db)
+				await asyncio.wait([self.event_hist.wait()], timeout=5)
+				self.event_hist.clear()
+
+	@metrics.timed
+	async def check_history(self, db):
+		urls = self.urls
+		query = self.sql_query.format(",".join("?" for _ in urls))
+		visited = set()
+
+		cursor = await db.cursor()
+		await cursor.execute(query, list(urls))
+		for (url,) in await cursor.fetchall():
+			visited.add(url)
+		self.publish("visited", visited)
+
 class Feeds(Gtk.EventBox):
 	def __init__(self, hist, feeds, spacing=3):
 		super().__init__()
 
 		self.icon = Gtk.Label("")
 		self.text = Gtk.Label()
+		util.stable_width(self.text)
 		box = Gtk.Box(spacing=spacing)
 		box.pack_start(self.icon, False, False, 0)
 		box.pack_start(self.text, False, False, 0)
@@ -38,75 +109,61 @@ class Feeds(Gtk.EventBox):
 		self.menu = Gtk.Menu(take_focus=False)
 		util.popupify(self.menu.get_parent(), self)
 
-		(self.sql_path, self.sql_query) = hist
-
 		self.imgs = []
+		self.tasks = {}
 
-		self.event_fetch = asyncio.Event()
-		self.event_hist = asyncio.Event()
-
-		menus, feeds = self.build_top_menu(self.menu, feeds)
-		asyncio.ensure_future(self.run(menus, feeds))
-		asyncio.ensure_future(self.update_hist())
+		self.menus, feeds = self.build_top_menu(self.menu, feeds)
+		self.provider = shared(FeedsProvider, hist, feeds)
+		self.provider.watch(self, "feeds", lambda feeds: self.restart("feeds", self.update_feeds(feeds)))
+		self.provider.watch(self, "visited", lambda visited: self.restart("visited", self.update_visited(visited)))
+		self.connect("destroy", lambda _: [task.cancel() for task in self.tasks.values()])
 
 		popup = lambda: self.menu.popup_at_widget(self, Gdk.Gravity.NORTH, Gdk.Gravity.SOUTH)
 		self.set_events(Gdk.EventMask.BUTTON_PRESS_MASK)
 		self.connect("button-press-event", lambda _, e: (e.type, e.button) == (Gdk.EventType.BUTTON_PRESS, 1) and popup())
-		self.connect("button-press-event", lambda _, e: (e.type, e.button) == (Gdk.EventType.BUTTON_PRESS, 2) and self.event_fetch.set())
-
-	async def run(self, menus, feeds):
-		async def load_feed(session, feed):
-			async with session.get(feed.url) as response:
-				return feed(await response.read())
-
-		assert len(feeds) == len(menus)
-
-		async with aiohttp.ClientSession() as session:
-			while True:
-				feeds_ = await asyncio.gather(*(load_feed(session, feed) for feed in feeds), return_exceptions=True)
-				self.imgs = []
-				for menu, feed in zip(menus, feeds_):
-					if isinstance(feed, BaseException):
-						util.print_exc(feed)
-						menu.set_tooltip_text(f"{type(feed).__name__}: {feed}")
-						menu.set_image(None)
-						menu.set_submenu(None)
-					else:
-						menu.set_tooltip_text(None)
-						submenu, img = self.build_menu(clean_all_urls(feed))
-						menu.set_image(img)
-						menu.set_submenu(submenu)
+		self.connect("button-press-event", lambda _, e: (e.type, e.button) == (Gdk.EventType.BUTTON_PRESS, 2) and self.provider.fetch())
 
-				self.event_hist.set()
-				await asyncio.wait([self.event_fetch.wait()], timeout=60*60)
-				self.event_fetch.clear()
+	def restart(self, name, coro):
+		# Menus are rebuilt in slices, so a newer result replaces one still in progress
+		if name in self.tasks:
+			self.tasks[name].cancel()
+		self.tasks[name] = asyncio.ensure_future(coro)
 
-	async def update_hist(self):
-		async with aiosqlite.connect(self.sql_path) as db:
-			while True:
-				urls = {url for img, url, top in self.imgs}
-				query = self.sql_query.format(",".join("?" for _ in urls))
-				visited = set()
-
-				cursor = await db.cursor()
-				await cursor.execute(query, list(urls))
-				for (url,) in await cursor.fetchall():
-					visited.add(url)
-
-				num = 0
-				for img, url, top in self.imgs:
-					if url in visited:
-						img.set_from_pixbuf(iconGray)
-					else:
-						img.set_from_pixbuf(icon)
-						num += top
-
-				self.set_opacity(0.5 if not num else 1)
-				self.text.set_text(str(num))
-				self.text.set_visible(bool(num))
+	@metrics.timed
+	async def update_feeds(self, feeds):
+		self.imgs = []
+		slice = lanes.Slice()
+		for menu, feed in zip(self.menus, feeds):
+			await slice()
+			if isinstance(feed, BaseException):
+				menu.set_tooltip_text(f"{type(feed).__name__}: {feed}")
+				menu.set_image(None)
+				menu.set_submenu(None)
+			else:
+				menu.set_tooltip_text(None)
+				submenu, img = self.build_menu(feed)
+				menu.set_image(img)
+				menu.set_submenu(submenu)
+
+		if "visited" in self.provider.values:
+			self.restart("visited", self.update_visited(self.provider.values["visited"]))
+
+	@metrics.timed
+	async def update_visited(self, visited):
+		icon, iconGray = get_icons()
+		num = 0
+		slice = lanes.Slice()
+		for img, url, top in list(self.imgs):
+			await slice()
+			if url in visited:
+				img.set_from_pixbuf(iconGray)
+			else:
+				img.set_from_pixbuf(icon)
+				num += top
 
-				await asyncio.wait([self.event_hist.wait()], timeout=5)
-				self.event_hist.clear()
+		frame.set_opacity(self, 0.5 if not num else 1)
+		frame.set_text(self.text, str(num))
+		frame.set_visible(self.text, bool(num))
 
 	def build_top_menu(self, menu, feeds):
 		menus = []
@@ -121,6 +178,7 @@ class Feeds(Gtk.EventBox):
 			feeds2.append(feed)
 		return menus, feeds2
 
+	@metrics.timed
 	def build_menu(self, feed):
 		img = Gtk.Image()
 		if feed[2]:
@@ -247,6 +305,7 @@ class FFNFeed(Feed):
 		super().__init__(name, "https://www.fanfiction.net/s/{}".format(id), **kwargs)
 
 	def load(self, data):
+		import bs4
 		soup = bs4.BeautifulSoup(data, features="lxml")
 		title = soup.find(id="profile_top").find("b").text
 		urlname = soup.find("link", rel="canonical")["href"].split("/")[-1]
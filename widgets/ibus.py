@@ -1,9 +1,62 @@
 import gi
 gi.require_version("IBus", "1.0")
 from gi.repository import Gtk, Gdk, GLib, IBus as _IBus
+import asyncio
+import sys
+import frame
+from provider import Provider, shared
+import metrics
 
 __all__ = ["IBus"]
 
+TIMEOUT = 2000 # ms
+BACKOFF = (1, 60) # s
+
+class IBusProvider(Provider):
+	# The bus connects asynchronously, and reconnects by itself if the daemon
+	# restarts; only the engine query needs a timeout and retry
+	def start(self):
+		self.delay = BACKOFF[0]
+		self.bus = _IBus.Bus.new_async()
+		self.bus.set_watch_ibus_signal(True)
+		self.handlers = [
+			self.bus.connect("global-engine-changed", self.change_engine),
+			self.bus.connect("connected", lambda bus: self.query_engine()),
+		]
+		if self.bus.is_connected():
+			self.query_engine()
+
+	def close(self):
+		# Dropping the last reference closes the connection
+		for handler in self.handlers:
+			self.bus.disconnect(handler)
+		self.bus = None
+
+	def query_engine(self):
+		self.bus.get_global_engine_async(TIMEOUT, None, self.got_engine)
+
+	def got_engine(self, bus, result):
+		if bus is not self.bus: return # Answered after close()
+		try:
+			engine = bus.get_global_engine_async_finish(result)
+		except GLib.Error as e:
+			print(f"ibus: {e.message}; retrying in {self.delay} s", file=sys.stderr)
+			self.spawn(self.retry(self.delay))
+			self.delay = min(self.delay * 2, BACKOFF[1])
+			return
+		self.delay = BACKOFF[0]
+		if engine is not None:
+			self.change_engine(bus, engine.get_name())
+
+	async def retry(self, delay):
+		await asyncio.sleep(delay)
+		if self.bus.is_connected():
+			self.query_engine()
+
+	@metrics.timed
+	def change_engine(self, bus, engine):
+		self.publish("engine", engine)
+
 class IBus(Gtk.EventBox):
 	def __init__(self, names):
 		super().__init__()
@@ -15,19 +68,15 @@ class IBus(Gtk.EventBox):
 		self.set_events(Gdk.EventMask.BUTTON_PRESS_MASK)
 		self.connect("button-press-event", self.click)
 
-		self.bus = _IBus.Bus.new()
-		self.bus.set_watch_ibus_signal(True)
-		self.bus.connect("global-engine-changed", self.change_engine)
-		GLib.idle_add(self.change_engine, self.bus, self.bus.get_global_engine().get_name(), priority=200)
+		shared(IBusProvider).watch(self, "engine", self.change_engine)
 
 		self.text.show()
 
-	def change_engine(self, bus, engine):
+	@metrics.timed
+	def change_engine(self, engine):
 		if engine in self.names:
-			self.text.set_text(self.names[engine])
-			self.show()
-		else:
-			self.hide()
+			frame.set_text(self.text, self.names[engine])
+		frame.set_visible(self, engine in self.names)
 
 	def click(self, _, evt):
 		pass
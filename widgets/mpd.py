@@ -1,4 +1,4 @@
-from gi.repository import Gtk, Gdk, Pango, Keybinder
+from gi.repository import Gtk, Gdk, Pango
 import cairo
 import os
 import os.path
@@ -6,6 +6,11 @@ import asyncio
 import re
 import enum
 import util
+import lanes
+import frame
+from policy import policy
+from provider import Provider, shared
+import metrics
 
 class MPDClosedError(Exception): pass
 class MPDError(Exception): pass
@@ -86,13 +91,8 @@ def run_mpd(f, *args):
 	async def coro():
 		async with MpdClient() as mpd:
 			return await f(mpd, *args)
-	return asyncio.ensure_future(coro())
+	return lanes.spawn(coro(), lanes.INTERACTIVE)
 
-def run_mpd_sync(f, *args):
-	async def coro():
-		async with MpdClient() as mpd:
-			return await f(mpd, *args)
-	return asyncio.get_event_loop().run_until_complete(coro())
 
 class save_state:
 	def __init__(self, mpd):
@@ -155,65 +155,23 @@ async def add_playlist(mpd, path, add):
 async def do_command(mpd, *command):
 	await mpd(*command)
 
-class MPD2(Gtk.EventBox):
-	def __init__(self, keys=False, spacing=3):
+class MPDProvider(Provider):
+	def __init__(self):
 		super().__init__()
-
-		self.icon = Gtk.Label()
-		self.text = ProgressLabel()
-		scroll = util.scrollable(self.text, h=False, v=None)
-		scroll.set_propagate_natural_width(True)
-		self.text.connect("hide", lambda _: scroll.hide())
-		self.text.connect("show", lambda _: scroll.show())
-		box = Gtk.Box(spacing=spacing)
-		box.pack_start(self.icon, False, False, 0)
-		box.pack_start(scroll, False, False, 0)
-		self.add(box)
-
 		self.treestore = Gtk.TreeStore(str, str, str) # Display name, search name, filename
+		self.ticker_running = asyncio.Event()
+		self.ticker_running.set()
+		self.filling = None
+		self.connect("changed", self.database_changed)
 
-		async def toggle_repeat(mpd):
-			status = dict(await mpd("status"))
-			if status["single"] == "1":
-				await mpd.list([["single", "0"], ["repeat", "0"]])
-			elif status["repeat"] == "1":
-				await mpd.list([["single", "1"], ["repeat", "1"]])
-			else:
-				await mpd.list([["single", "0"], ["repeat", "1"]])
-		self.repBtn = Gtk.Button(image=Gtk.Image())
-		self.repBtn.connect("clicked", lambda _: run_mpd(toggle_repeat))
-		self.repBtn.connect("clicked", lambda b: b.set_state_flags(Gtk.StateFlags.CHECKED, False))
-
-		async def toggle_shuffle(mpd):
-			status = dict(await mpd("status"))
-			await mpd("random", "01"[status["random"] == "0"])
-		self.shufBtn = Gtk.Button(image=Gtk.Image())
-		self.shufBtn.connect("clicked", lambda _: run_mpd(toggle_shuffle))
-		self.shufBtn.connect("clicked", lambda b: b.set_state_flags(Gtk.StateFlags.CHECKED, False))
-
-		p = Gdk.EventType.BUTTON_PRESS
-		self.set_events(Gdk.EventMask.BUTTON_PRESS_MASK)
-		self.connect("button-press-event", lambda _, e: (e.type, e.button) == (p, 3) and self.open_popup())
-		self.icon.set_has_window(True)
-		self.icon.set_events(Gdk.EventMask.BUTTON_PRESS_MASK)
-		self.icon.connect("button-press-event", lambda _, e: (e.type, e.button) == (p, 1) and run_mpd(do_toggle))
-		self.icon.connect("button-press-event", lambda _, e: (e.type, e.button) == (p, 2) and run_mpd(do_stop))
-		self.text.set_has_window(True)
-		self.text.set_events(Gdk.EventMask.BUTTON_PRESS_MASK)
-		async def click_text(mpd, pos):
-			if pos < .05:
-				await do_prev(mpd)
-			elif pos > .95:
-				await do_next(mpd)
-			else:
-				status = dict(await mpd("status"))
-				if "duration" in status:
-					await mpd("seekcur", str(pos * float(status["duration"])))
-		self.text.connect("button-press-event", lambda l, e: (e.type, e.button) == (p, 1) and run_mpd(click_text, e.x / l.get_allocated_width()))
-
-		self.popup = None
+	def start(self):
+		self.spawn(self.run_ticker())
+		self.spawn(self.run_idler())
 
-		if keys:
+	def bind_keys(self):
+		if not getattr(self, "keys_bound", False):
+			self.keys_bound = True
+			from gi.repository import Keybinder
 			Keybinder.bind("AudioPlay", lambda _: run_mpd(do_toggle))
 			Keybinder.bind("<Shift>AudioPlay", lambda _: run_mpd(do_stop))
 			Keybinder.bind("AudioPrev", lambda _: run_mpd(do_prev))
@@ -221,11 +179,6 @@ class MPD2(Gtk.EventBox):
 			Keybinder.bind("AudioNext", lambda _: run_mpd(do_next))
 			Keybinder.bind("<Shift>AudioNext", lambda _: run_mpd(do_next2))
 
-		self.ticker_running = asyncio.Event()
-		self.ticker_running.set()
-		asyncio.ensure_future(self.run_ticker())
-		asyncio.ensure_future(self.run_idler())
-
 	async def run_ticker(self):
 		while True:
 			try:
@@ -233,7 +186,7 @@ class MPD2(Gtk.EventBox):
 					while True:
 						await self.ticker_running.wait()
 						await self.update_status(mpd)
-						await asyncio.sleep(0.1)
+						await policy.sleep(0.1)
 			except MPDClosedError as e:
 				await asyncio.sleep(1)
 
@@ -253,86 +206,187 @@ class MPD2(Gtk.EventBox):
 				self.set_state(MpdState.error)
 				await asyncio.sleep(1)
 
+	@metrics.timed
 	async def update_database(self, mpd):
-		async def create_playlist(mpd, node, path):
+		# Published as nested (display name, search name, filename, children)
+		# rows; the tree store is filled from that
+		async def walk(path):
 			files = []
 			for k, v in await mpd("lsinfo", path):
 				if k in ["file", "directory"]:
 					files.append({"_type": k})
 				files[-1][k] = v
 
+			rows = []
 			for f in files:
 				if f["_type"] == "file":
-					self.treestore.append(node, row=[gettitle(f, num=True), gettitle(f), f["file"]])
+					rows.append((gettitle(f, num=True), gettitle(f), f["file"], ()))
 				elif f["_type"] == "directory":
 					dirname = os.path.basename(f["directory"])
-					child = self.treestore.append(node, row=[dirname, dirname, f["directory"]])
-					await create_playlist(mpd, child, f["directory"])
+					rows.append((dirname, dirname, f["directory"], await walk(f["directory"])))
+			return rows
+
+		self.publish("database", await walk(""))
+
+	def database_changed(self, _, key, rows):
+		if key != "database": return
+		if self.filling is not None:
+			self.filling.cancel()
+		self.filling = asyncio.ensure_future(self.fill_tree(rows))
+
+	@metrics.timed
+	async def fill_tree(self, rows):
+		slice = lanes.Slice()
+		async def add(node, rows):
+			for name, search, file, children in rows:
+				await slice()
+				child = self.treestore.append(node, row=[name, search, file])
+				if children:
+					await add(child, children)
 
 		self.treestore.clear()
 		self.treestore.append(None, row=["—", "", ""])
-		await create_playlist(mpd, None, "")
+		await add(None, rows)
 
+	@metrics.timed
 	async def update_status(self, mpd):
 		status = dict(await mpd("status"))
 		self.set_state(MpdState[status["state"]])
 
 		if "elapsed" in status and "duration" in status:
-			self.text.set_bounds(float(status["elapsed"]), float(status["duration"]))
+			self.publish("bounds", (float(status["elapsed"]), float(status["duration"])))
 
 		song = dict(await mpd("currentsong"))
-		self.text.set_text(gettitle(song))
+		self.publish("title", gettitle(song))
 
+	@metrics.timed
 	def set_state(self, state):
-		self.icon.set_text(""[state])
-		self.text.set_visible(state >= MpdState.pause)
-		self.set_opacity(1 if state >= MpdState.pause else 0.25)
-
+		self.publish("state", state)
 		if state == MpdState.play:
 			self.ticker_running.set()
 		else:
 			self.ticker_running.clear()
 
+	@metrics.timed
 	async def update_options(self, mpd):
 		status = dict(await mpd("status"))
+		self.publish("options", {k: int(status[k]) for k in ["single", "repeat", "random"]})
+
+class MPD2(Gtk.EventBox):
+	def __init__(self, keys=False, spacing=3):
+		super().__init__()
+
+		self.icon = Gtk.Label()
+		self.text = ProgressLabel()
+		util.stable_width(self.text, shrink_after=3)
+		scroll = util.scrollable(self.text, h=False, v=None)
+		scroll.set_propagate_natural_width(True)
+		self.text.connect("hide", lambda _: scroll.hide())
+		self.text.connect("show", lambda _: scroll.show())
+		box = Gtk.Box(spacing=spacing)
+		box.pack_start(self.icon, False, False, 0)
+		box.pack_start(scroll, False, False, 0)
+		self.add(box)
+
+		self.provider = shared(MPDProvider)
+		self.treestore = self.provider.treestore
+
+		async def toggle_repeat(mpd):
+			status = dict(await mpd("status"))
+			if status["single"] == "1":
+				await mpd.list([["single", "0"], ["repeat", "0"]])
+			elif status["repeat"] == "1":
+				await mpd.list([["single", "1"], ["repeat", "1"]])
+			else:
+				await mpd.list([["single", "0"], ["repeat", "1"]])
+		self.repBtn = Gtk.Button(image=Gtk.Image())
+		self.repBtn.connect("clicked", lambda _: run_mpd(toggle_repeat))
+		self.repBtn.connect("clicked", lambda b: b.set_state_flags(Gtk.StateFlags.CHECKED, False))
+
+		async def toggle_shuffle(mpd):
+			status = dict(await mpd("status"))
+			await mpd("random", "01"[status["random"] == "0"])
+		self.shufBtn = Gtk.Button(image=Gtk.Image())
+		self.shufBtn.connect("clicked", lambda _: run_mpd(toggle_shuffle))
+		self.shufBtn.connect("clicked", lambda b: b.set_state_flags(Gtk.StateFlags.CHECKED, False))
+
+		p = Gdk.EventType.BUTTON_PRESS
+		self.set_events(Gdk.EventMask.BUTTON_PRESS_MASK)
+		self.connect("button-press-event", lambda _, e: (e.type, e.button) == (p, 3) and self.popup.show())
+		self.icon.set_has_window(True)
+		self.icon.set_events(Gdk.EventMask.BUTTON_PRESS_MASK)
+		self.icon.connect("button-press-event", lambda _, e: (e.type, e.button) == (p, 1) and run_mpd(do_toggle))
+		self.icon.connect("button-press-event", lambda _, e: (e.type, e.button) == (p, 2) and run_mpd(do_stop))
+		self.text.set_has_window(True)
+		self.text.set_events(Gdk.EventMask.BUTTON_PRESS_MASK)
+		async def click_text(mpd, pos):
+			if pos < .05:
+				await do_prev(mpd)
+			elif pos > .95:
+				await do_next(mpd)
+			else:
+				status = dict(await mpd("status"))
+				if "duration" in status:
+					await mpd("seekcur", str(pos * float(status["duration"])))
+		self.text.connect("button-press-event", lambda l, e: (e.type, e.button) == (p, 1) and run_mpd(click_text, e.x / l.get_allocated_width()))
+
+		self.popup = util.Popup(self, self.build_popup, self.refresh_popup)
+
+		if keys:
+			self.provider.bind_keys()
+
+		self.provider.watch(self, "state", self.set_state)
+		self.provider.watch(self, "bounds", lambda bounds: self.text.set_bounds(*bounds))
+		self.provider.watch(self, "title", lambda title: frame.set_text(self.text, title))
+		self.provider.watch(self, "options", self.update_options)
+
+	@metrics.timed
+	def set_state(self, state):
+		frame.set_text(self.icon, ""[state])
+		frame.set_visible(self.text, state >= MpdState.pause)
+		frame.set_opacity(self, 1 if state >= MpdState.pause else 0.25)
+
+	@metrics.timed
+	def update_options(self, status):
 		set_icon = lambda c, s: c.get_image().set_from_icon_name(f"media-playlist-{s}-symbolic", Gtk.IconSize.BUTTON)
 		set_flag = lambda c, f, v: c.set_state_flags(f, False) if v else c.unset_state_flags(f)
 
-		set_icon(self.repBtn, "repeat" + "-song" * int(status["single"]))
+		set_icon(self.repBtn, "repeat" + "-song" * status["single"])
 		set_icon(self.shufBtn, "shuffle")
-		set_flag(self.repBtn, Gtk.StateFlags.CHECKED, int(status["repeat"]))
-		set_flag(self.shufBtn, Gtk.StateFlags.CHECKED, int(status["random"]))
+		set_flag(self.repBtn, Gtk.StateFlags.CHECKED, status["repeat"])
+		set_flag(self.shufBtn, Gtk.StateFlags.CHECKED, status["random"])
 
-	def open_popup(self):
-		tree = Gtk.TreeView(self.treestore, enable_search=True, search_column=1, headers_visible=False)
+	@metrics.timed
+	def build_popup(self):
+		tree = self.tree = Gtk.TreeView(self.treestore, enable_search=True, search_column=1, headers_visible=False)
 		tree.set_search_equal_func(search_tree, tree)
 		tree.insert_column_with_attributes(0, "Title", Gtk.CellRendererText(), text=0)
 		tree.connect("row-activated", lambda _, path, __: run_mpd(add_playlist, tree.get_model()[path][-1], getattr(Gtk.get_current_event(), "state", 0) & Gdk.ModifierType.SHIFT_MASK))
 
-		@run_mpd_sync
-		async def coro(mpd):
-			current_song = dict(await mpd("currentsong")).get("file")
-			def walk(model, path, iter):
-				if model[iter][-1] == current_song:
-					tree.expand_to_path(path)
-					tree.scroll_to_cell(path, None, True, 0.5, 0.5)
-					tree.set_cursor(path, None, False)
-			self.treestore.foreach(walk)
-
 		vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
 		stree = util.scrollable(tree, h=None)
 		stree.set_size_request(0, 300)
 		vbox.pack_start(stree, False, False, 0)
 
 		buttons = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, halign=Gtk.Align.CENTER, spacing=4)
-		self.repBtn.unparent()
-		self.shufBtn.unparent()
 		buttons.add(self.repBtn)
 		buttons.add(self.shufBtn)
 		vbox.pack_end(buttons, True, True, 2)
 
-		self.popup = util.make_popup(util.framed(vbox), self)
-		self.popup.show_all()
+		return util.framed(vbox)
+
+	def refresh_popup(self):
+		# The popup opens right away, and jumps to the current song once MPD says which it is
+		async def coro(mpd):
+			current_song = dict(await mpd("currentsong")).get("file")
+			def walk(model, path, iter):
+				if model[iter][-1] == current_song:
+					self.tree.expand_to_path(path)
+					self.tree.scroll_to_cell(path, None, True, 0.5, 0.5)
+					self.tree.set_cursor(path, None, False)
+					return True
+			self.treestore.foreach(walk)
+		run_mpd(coro)
 
 class ProgressLabel(Gtk.Label):
 	def __init__(self):
@@ -342,25 +396,23 @@ class ProgressLabel(Gtk.Label):
 	def set_bounds(self, current, max):
 		self.current = current
 		self.max = max
-		self.queue_draw()
+		frame.queue_draw(self)
 
+	@metrics.timed
 	def do_draw(self, ctx):
 		Gtk.Label.do_draw(self, ctx) # super() doesn't work for some reason
 
 		if not self.current or not self.max: return
 
-		style = self.get_style_context()
-		color = style.get_color(style.get_state())
-
+		cache = util.style_cache(self)
 		ctx.set_line_cap(cairo.LINE_CAP_BUTT)
-		ctx.set_source_rgba(*color)
+		ctx.set_source_rgba(*cache.color())
 
-		pango = self.get_pango_context()
-		metrics = pango.get_metrics()
+		font_metrics = cache.font_metrics()
 		height = self.get_allocated_height() * Pango.SCALE
-		pos = (height + metrics.get_ascent()-metrics.get_descent())/2
+		pos = (height + font_metrics.get_ascent()-font_metrics.get_descent())/2
 
-		upos, thick = metrics.get_underline_position(), metrics.get_underline_thickness()
+		upos, thick = font_metrics.get_underline_position(), font_metrics.get_underline_thickness()
 		pos -= upos
 		pos /= Pango.SCALE
 		thick /= Pango.SCALE
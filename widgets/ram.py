@@ -1,25 +1,38 @@
-from gi.repository import Gtk, Gdk, GLib
+from gi.repository import Gtk, Gdk
 from psutil import virtual_memory
+import util
+import frame
+from provider import Provider, shared
+import metrics
 
 __all__ = ["RAM"]
 
+class RAMProvider(Provider):
+	def start(self):
+		self.every(1, self.update)
+		self.update()
+
+	@metrics.timed
+	def update(self):
+		self.publish("memory", virtual_memory())
+		return True
+
 class RAM(Gtk.EventBox):
 	def __init__(self):
 		super().__init__()
 
 		self.text = Gtk.Label()
+		util.stable_width(self.text)
 		self.add(self.text)
 
-		GLib.timeout_add_seconds(1, self.update)
-		self.update()
+		shared(RAMProvider).watch(self, "memory", self.update)
 
 		self.set_events(Gdk.EventMask.BUTTON_PRESS_MASK)
 		self.connect("button-press-event", self.click)
 
-	def update(self):
-		mem = virtual_memory()
-		self.text.set_text("{:.1f} MB".format((mem.total - mem.available) / 1024**2))
-		return True
+	@metrics.timed
+	def update(self, mem):
+		frame.set_text(self.text, "{:.1f} MB".format((mem.total - mem.available) / 1024**2))
 
 	def click(self, _, evt):
 		pass
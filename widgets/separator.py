@@ -1,6 +1,7 @@
 from gi.repository import Gtk
 import cairo
 import util
+import metrics
 
 __all__ = ["Separator"]
 
@@ -8,19 +9,21 @@ class Separator(Gtk.DrawingArea):
 	def __init__(self):
 		super().__init__()
 		self.connect("draw", self.draw)
+		self.connect("realize", lambda self: self.get_window().set_child_input_shapes())
 		self.set_size_request(1, 0)
 
+	@metrics.timed
 	def draw(self, _, ctx):
 		ctx.set_antialias(cairo.ANTIALIAS_NONE)
 		ctx.set_line_width(self.get_allocated_width())
 		ctx.set_line_join(cairo.LINE_JOIN_BEVEL)
 		ctx.set_line_cap(cairo.LINE_CAP_BUTT)
 
-		style = self.get_style_context()
-		color = style.get_color(style.get_state())
+		cache = util.style_cache(self)
+		color = cache.color().copy()
 		color.alpha /= 4
 
-		font_height = util.get_height(self)
+		font_height = cache.font_height()
 		height = self.get_allocated_height()
 		ctx.translate(0, (height - font_height) / 2)
 
@@ -28,5 +31,3 @@ class Separator(Gtk.DrawingArea):
 		ctx.move_to(1, 0)
 		ctx.line_to(1, font_height)
 		ctx.stroke()
-
-		self.get_window().set_child_input_shapes()
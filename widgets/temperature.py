@@ -1,14 +1,19 @@
-from gi.repository import Gtk, GLib
+from gi.repository import Gtk
 import re
 import subprocess
 import util
+import frame
+from provider import Provider, shared
+import metrics
 
 __all__ = ["Temperature"]
 
 input_re = re.compile(r"^  (\w+)(\d+)_(\w+): (\d+\.\d+)$")
 
 def get_temps():
-	out = subprocess.check_output(["sensors", "-u"]).decode()
+	return parse_sensors(subprocess.check_output(["sensors", "-u"]).decode())
+
+def parse_sensors(out):
 	it = iter(out.splitlines())
 	for chip in it:
 		adapter = next(it)
@@ -30,6 +35,16 @@ def get_temps():
 				sensors[-1][key] = float(val)
 		yield chip, adapter, sensors
 
+class TemperatureProvider(Provider):
+	def start(self):
+		self.every(1, self.update)
+		self.update()
+
+	@metrics.timed
+	def update(self):
+		self.publish("temps", list(get_temps()))
+		return True
+
 class Temperature(Gtk.EventBox):
 	def __init__(self, chip, which, idle, crit=None, spacing=3):
 		super().__init__()
@@ -40,44 +55,61 @@ class Temperature(Gtk.EventBox):
 
 		self.icon = Gtk.Label()
 		self.text = Gtk.Label()
+		util.stable_width(self.text)
 		box = Gtk.Box(spacing=spacing)
 		box.pack_start(self.icon, False, False, 0)
 		box.pack_start(self.text, False, False, 0)
 		self.add(box)
 
-		GLib.timeout_add_seconds(1, self.update)
-		self.update()
+		# The provider's readings are at most a second old, so the tooltip
+		# doesn't need to run sensors itself
+		self.provider = shared(TemperatureProvider)
+		self.tooltip = util.Tooltip(self,
+			lambda: Gtk.Box(orientation=Gtk.Orientation.VERTICAL),
+			self.fill_tooltip,
+			lambda: self.provider.values.get("temps"))
+		self.tooltip_rows = None
+		self.provider.watch(self, "temps", self.update)
 
-		def tooltip(self, x, y, keyboard, tooltip):
-			self.tooltip = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
-			for chip, adapter, sensors in get_temps():
+		self.icon.show()
+		self.text.show()
+		box.show()
+		self.show()
+
+	def fill_tooltip(self, tree, temps):
+		if temps is None: return False
+		# The rows are only rebuilt if the set of chips and sensors changes
+		shape = [(chip, adapter, [sensor["name"] for sensor in sensors]) for chip, adapter, sensors in temps]
+		if self.tooltip_rows is None or self.tooltip_rows[0] != shape:
+			for child in tree.get_children():
+				child.destroy()
+			values = []
+			for chip, adapter, names in shape:
 				label = Gtk.Label(xalign=0)
 				label.set_markup(f"<b>{chip}</b>: <i>{adapter}</i>")
-				self.tooltip.pack_start(label, True, True, 0)
+				tree.pack_start(label, True, True, 0)
 
-				for sensor in sensors:
-					format = {"temp": "{:.1f} °C", "fan": "{:.0f} RPM"}.get(sensor["type"], "{}")
-					left = Gtk.Label(sensor["name"])
-					right = Gtk.Label(format.format(sensor["input"]))
+				for name in names:
+					left = Gtk.Label(name)
+					right = Gtk.Label()
 					box = Gtk.Box(spacing=7)
 					box.pack_start(left, False, False, 15)
 					box.pack_end(right, False, False, 15)
-					self.tooltip.pack_start(box, True, True, 0)
-
-			self.tooltip.show_all()
-			tooltip.set_custom(self.tooltip)
-			return True
-		self.connect("query-tooltip", tooltip)
-		self.set_has_tooltip(True)
+					tree.pack_start(box, True, True, 0)
+					values.append(right)
+			self.tooltip_rows = (shape, values)
 
-		self.icon.show()
-		self.text.show()
-		box.show()
-		self.show()
+		values = iter(self.tooltip_rows[1])
+		for chip, adapter, sensors in temps:
+			for sensor in sensors:
+				format = {"temp": "{:.1f} °C", "fan": "{:.0f} RPM"}.get(sensor.get("type"), "{}")
+				next(values).set_text(format.format(sensor.get("input")))
 
-	def update(self):
+	@metrics.timed
+	def update(self, temps):
+		self.tooltip.changed()
 		sensor = None
-		for chip, adapter, sensors in get_temps():
+		for chip, adapter, sensors in temps:
 			if chip == self.chip:
 				for sensor in sensors:
 					if sensor["name"] == self.which:
@@ -85,7 +117,5 @@ class Temperature(Gtk.EventBox):
 
 		crit = sensor.get("crit", self.crit)
 		temp = sensor.get("input", 0.0)
-		self.icon.set_text(util.symbol(["", "", "", "", ""], (temp-self.idle)/(crit-self.idle)))
-		self.text.set_text("{:.0f}°C".format(temp))
-
-		return True
+		frame.set_text(self.icon, util.symbol(["", "", "", "", ""], (temp-self.idle)/(crit-self.idle)))
+		frame.set_text(self.text, "{:.0f}°C".format(temp))
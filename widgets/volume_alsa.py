@@ -1,29 +1,27 @@
 from gi.repository import Gtk, GLib
 import simplealsa
+import util
+import frame
+from provider import Provider, shared
+import metrics
 
 __all__ = ["AlsaVolume"]
 
-class AlsaVolume(Gtk.EventBox):
-	def __init__(self, card="hw:0", name=("Master", "Speaker"), id=0, base=80, spacing=3):
+class AlsaProvider(Provider):
+	def __init__(self, card, name):
 		super().__init__()
+		self.card = card
+		self.name = name
 
-		self.icon = Gtk.Label("♪")
-		self.text = Gtk.Label()
-		box = Gtk.Box(spacing=spacing)
-		box.pack_start(self.icon, False, False, 0)
-		box.pack_start(self.text, False, False, 0)
-		self.add(box)
-
-		self.icon.show()
-		self.text.show()
-		box.show()
-		self.show()
+	def start(self):
+		self.connect_backend(f"alsa {self.card}", self.open_mixer, self.opened)
 
-		self.base = base
+	def open_mixer(self):
+		alsa = simplealsa.Alsa(self.card)
+		return alsa, alsa.selem(self.name[0]), alsa.selem(self.name[1])
 
-		self.alsa = simplealsa.Alsa(card)
-		self.volume = self.alsa.selem(name[0])
-		self.mute = self.alsa.selem(name[1])
+	def opened(self, result):
+		self.alsa, self.volume, self.mute = result
 
 		self.min, self.max = self.volume.mB_range
 
@@ -36,9 +34,46 @@ class AlsaVolume(Gtk.EventBox):
 			self.alsa.handle_events()
 			return True
 		for fd in self.alsa.fds():
-			GLib.io_add_watch(fd.fd, GLib.IO_IN, update)
+			self.sources.append(GLib.io_add_watch(fd.fd, GLib.IO_IN, update))
 
+	def close(self):
+		# The watches go with the sources; this lets the mixer handle close
+		self.alsa = self.volume = self.mute = None
+
+	@metrics.timed
 	def update_volume(self, *_):
-		self.text.set_text("{:.1f} dB".format(self.volume.mB.all / 100 + self.base))
+		self.publish("volume", self.volume.mB.all / 100)
+	@metrics.timed
 	def update_mute(self, *_):
-		self.set_opacity(1 if self.mute.switch.all else 0.5)
+		self.publish("mute", not self.mute.switch.all)
+
+class AlsaVolume(Gtk.EventBox):
+	def __init__(self, card="hw:0", name=("Master", "Speaker"), id=0, base=80, spacing=3):
+		super().__init__()
+
+		self.icon = Gtk.Label("♪")
+		self.text = Gtk.Label()
+		util.stable_width(self.text)
+		box = Gtk.Box(spacing=spacing)
+		box.pack_start(self.icon, False, False, 0)
+		box.pack_start(self.text, False, False, 0)
+		self.add(box)
+
+		frame.set_opacity(self, 0.5) # Until the mixer is open
+		self.icon.show()
+		self.text.show()
+		box.show()
+		self.show()
+
+		self.base = base
+
+		provider = shared(AlsaProvider, card, tuple(name))
+		provider.watch(self, "volume", self.update_volume)
+		provider.watch(self, "mute", self.update_mute)
+
+	@metrics.timed
+	def update_volume(self, volume):
+		frame.set_text(self.text, "{:.1f} dB".format(volume + self.base))
+	@metrics.timed
+	def update_mute(self, mute):
+		frame.set_opacity(self, 0.5 if mute else 1)
@@ -1,7 +1,13 @@
-from gi.repository import Gtk, Gdk, Keybinder
+from gi.repository import Gtk, Gdk
+import asyncio
+import concurrent.futures
 import os
+import sys
 import dbus
 import util
+import frame
+from provider import Provider, shared
+import metrics
 
 __all__ = ["Volume"]
 
@@ -30,45 +36,164 @@ def pulse_bus_address():
 		address = server_lookup.Get("org.PulseAudio.ServerLookup1", "Address", dbus_interface=PROPS)
 	return address
 
+def stop_listening(core):
+	core.StopListeningForSignal("org.PulseAudio.Core1.Device.VolumeUpdated", dbus_interface="org.PulseAudio.Core1")
+	core.StopListeningForSignal("org.PulseAudio.Core1.Device.MuteUpdated", dbus_interface="org.PulseAudio.Core1")
+
+def open_sink(bus, core, path, listening):
+	# Blocking; returns the sink and its current volume and mute
+	if listening:
+		stop_listening(core)
+	sink = bus.get_object(None, path)
+	core.ListenForSignal("org.PulseAudio.Core1.Device.VolumeUpdated", [sink], dbus_interface="org.PulseAudio.Core1")
+	core.ListenForSignal("org.PulseAudio.Core1.Device.MuteUpdated", [sink], dbus_interface="org.PulseAudio.Core1")
+	volume = sink.Get("org.PulseAudio.Core1.Device", "Volume", dbus_interface=PROPS)
+	mute = sink.Get("org.PulseAudio.Core1.Device", "Mute", dbus_interface=PROPS)
+	return sink, volume, mute
+
+class PulseProvider(Provider):
+	def __init__(self):
+		super().__init__()
+		self.pulse_bus = None
+		self.default_sink = None
+
+	def start(self):
+		# Every call that waits on PulseAudio runs on this one thread, in order,
+		# so a stalled daemon can't hold up the bar
+		self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="pulse")
+		self.next_sink = None
+		self.switching = None
+		self.connect_backend("pulse", self.connect_pulse, self.connected)
+
+	def connect_pulse(self):
+		# Runs in a thread; only blocking lookups go here
+		bus = dbus.connection.Connection(pulse_bus_address())
+		core = bus.get_object(None, "/org/pulseaudio/core1")
+		core.ListenForSignal("org.PulseAudio.Core1.FallbackSinkUpdated", [core], dbus_interface="org.PulseAudio.Core1")
+		core.ListenForSignal("org.PulseAudio.Core1.FallbackSinkUnset", [core], dbus_interface="org.PulseAudio.Core1")
+		sink = core.Get("org.PulseAudio.Core1", "FallbackSink", dbus_interface=PROPS)
+		return bus, core, open_sink(bus, core, sink, False)
+
+	def connected(self, result):
+		self.pulse_bus, self.pulse_core, sink = result
+		self.sink_opened(sink)
+
+		self.pulse_bus.add_signal_receiver(self.updateSink, "FallbackSinkUpdated")
+		self.pulse_bus.add_signal_receiver(self.unsetSink, "FallbackSinkUnset")
+		self.pulse_bus.add_signal_receiver(self.updateVolume, "VolumeUpdated")
+		self.pulse_bus.add_signal_receiver(self.updateMute, "MuteUpdated")
+
+	def close(self):
+		if self.pulse_bus is not None:
+			self.pulse_bus.remove_signal_receiver(self.updateSink, "FallbackSinkUpdated")
+			self.pulse_bus.remove_signal_receiver(self.unsetSink, "FallbackSinkUnset")
+			self.pulse_bus.remove_signal_receiver(self.updateVolume, "VolumeUpdated")
+			self.pulse_bus.remove_signal_receiver(self.updateMute, "MuteUpdated")
+			self.pulse_bus.close()
+		self.pulse_bus = self.pulse_core = self.default_sink = None
+		self.executor.shutdown(wait=False)
+		if getattr(self, "keys_bound", False):
+			self.keys_bound = False
+			from gi.repository import Keybinder
+			for key in ["AudioMute", "AudioRaiseVolume", "AudioLowerVolume"]:
+				Keybinder.unbind(key)
+
+	def bind_keys(self):
+		if not getattr(self, "keys_bound", False):
+			self.keys_bound = True
+			from gi.repository import Keybinder
+			Keybinder.bind("AudioMute", self.toggleMute)
+			Keybinder.bind("AudioRaiseVolume", self.changeVolume, +5)
+			Keybinder.bind("AudioLowerVolume", self.changeVolume, -5)
+
+	def in_thread(self, f, *args):
+		return asyncio.get_event_loop().run_in_executor(self.executor, f, *args)
+
+	def unsetSink(self):
+		if self.default_sink is not None:
+			self.default_sink = None
+			self.spawn(self.in_thread(stop_listening, self.pulse_core))
+
+	def updateSink(self, sink):
+		# Only the latest sink matters if they change faster than PulseAudio answers
+		self.next_sink = sink
+		if self.switching is None or self.switching.done():
+			self.switching = self.spawn(self.switch_sink())
+
+	async def switch_sink(self):
+		while self.next_sink is not None:
+			sink, self.next_sink = self.next_sink, None
+			try:
+				result = await self.in_thread(open_sink, self.pulse_bus, self.pulse_core, sink, self.default_sink is not None)
+			except dbus.DBusException as e:
+				print(f"pulse: {e}", file=sys.stderr)
+				continue
+			self.sink_opened(result)
+
+	def sink_opened(self, result):
+		self.default_sink, volume, mute = result
+		self.updateVolume(volume)
+		self.updateMute(mute)
+
+	@metrics.timed
+	def updateVolume(self, vol):
+		self.publish("volume", int(max(vol)))
+
+	@metrics.timed
+	def updateMute(self, mute):
+		self.publish("mute", bool(mute))
+
+	def set_property(self, name, value):
+		# Doesn't wait for the reply; the change comes back as a signal
+		self.default_sink.Set("org.PulseAudio.Core1.Device", name, value, dbus_interface=PROPS,
+			reply_handler=lambda: None, error_handler=lambda e: print(f"pulse: {e}", file=sys.stderr))
+
+	def setVolume(self, val):
+		if self.default_sink is None: return
+		self.set_property("Volume", dbus.Array([int(val)], "u"))
+
+	def toggleMute(self, _=None):
+		if self.default_sink is None: return
+		self.set_property("Mute", not self.values.get("mute"))
+
+	def changeVolume(self, _, d):
+		if self.default_sink is None or "volume" not in self.values: return
+		val = self.values["volume"]
+		val = round(val / VOLUME_NORM * 100 + d) * VOLUME_NORM / 100
+		if val < 0: val = 0
+		self.setVolume(val)
+
 class Volume(Gtk.EventBox):
 	def __init__(self, keys=False, spacing=3):
 		super().__init__()
 
 		self.icon = Gtk.Label()
 		self.text = Gtk.Label()
+		util.stable_width(self.text)
 		box = Gtk.Box(spacing=spacing)
 		box.pack_start(self.icon, False, False, 0)
 		box.pack_start(self.text, False, False, 0)
 		self.add(box)
 
+		# Shown dimmed until PulseAudio answers
+		frame.set_text(self.icon, "♪")
+		frame.set_opacity(self, 0.5)
 		self.icon.show()
 		self.text.show()
 		box.show()
 		self.show()
 
-		self.build_popup()
+		self.popup = util.Popup(self, self.build_popup, self.refresh_popup)
 
 		self.set_events(Gdk.EventMask.BUTTON_PRESS_MASK)
 		self.connect("button-press-event", self.click)
 
-		self.pulse_bus = dbus.connection.Connection(pulse_bus_address())
-		self.pulse_core = self.pulse_bus.get_object(None, "/org/pulseaudio/core1")
-
-		self.pulse_core.ListenForSignal("org.PulseAudio.Core1.FallbackSinkUpdated", [self.pulse_core], dbus_interface="org.PulseAudio.Core1")
-		self.pulse_core.ListenForSignal("org.PulseAudio.Core1.FallbackSinkUnset", [self.pulse_core], dbus_interface="org.PulseAudio.Core1")
-
-		self.default_sink = None
-		self.updateSink(self.pulse_core.Get("org.PulseAudio.Core1", "FallbackSink", dbus_interface=PROPS))
-
-		self.pulse_bus.add_signal_receiver(self.updateSink, "FallbackSinkUpdated")
-		self.pulse_bus.add_signal_receiver(self.unsetSink, "FallbackSinkUnset")
-		self.pulse_bus.add_signal_receiver(self.updateVolume, "VolumeUpdated")
-		self.pulse_bus.add_signal_receiver(self.updateMute, "MuteUpdated")
+		self.provider = shared(PulseProvider)
+		self.provider.watch(self, "volume", self.updateVolume)
+		self.provider.watch(self, "mute", self.updateMute)
 
 		if keys:
-			Keybinder.bind("AudioMute", self.toggleMute)
-			Keybinder.bind("AudioRaiseVolume", self.changeVolume, +5)
-			Keybinder.bind("AudioLowerVolume", self.changeVolume, -5)
+			self.provider.bind_keys()
 
 	def build_popup(self):
 		self.label = Gtk.Label()
@@ -80,7 +205,7 @@ class Volume(Gtk.EventBox):
 		self.slider.connect("change-value", self.changeSlider)
 		self.button = Gtk.ToolButton()
 		self.button.set_halign(Gtk.Align.CENTER)
-		self.button.connect("clicked", self.toggleMute)
+		self.button.connect("clicked", lambda _: self.provider.toggleMute())
 
 		self.slider.set_orientation(Gtk.Orientation.VERTICAL)
 		self.slider.set_inverted(True)
@@ -90,53 +215,33 @@ class Volume(Gtk.EventBox):
 		box.pack_start(self.label, False, False, 0)
 		box.pack_start(self.slider, True, True, 0)
 		box.pack_start(self.button, False, False, 0)
-		self.popup = util.make_popup(util.framed(box), self)
+		return util.framed(box)
 
-	def unsetSink(self):
-		if self.default_sink:
-			self.pulse_core.StopListeningForSignal("org.PulseAudio.Core1.Device.VolumeUpdated", dbus_interface="org.PulseAudio.Core1")
-			self.pulse_core.StopListeningForSignal("org.PulseAudio.Core1.Device.MuteUpdated", dbus_interface="org.PulseAudio.Core1")
-
-	def updateSink(self, sink):
-		self.unsetSink()
-		self.default_sink = self.pulse_bus.get_object(None, sink)
-		self.pulse_core.ListenForSignal("org.PulseAudio.Core1.Device.VolumeUpdated", [self.default_sink], dbus_interface="org.PulseAudio.Core1")
-		self.pulse_core.ListenForSignal("org.PulseAudio.Core1.Device.MuteUpdated", [self.default_sink], dbus_interface="org.PulseAudio.Core1")
-		self.updateVolume(self.default_sink.Get("org.PulseAudio.Core1.Device", "Volume", dbus_interface=PROPS))
-		self.updateMute(self.default_sink.Get("org.PulseAudio.Core1.Device", "Mute", dbus_interface=PROPS))
+	def refresh_popup(self):
+		values = self.provider.values
+		if "volume" in values:
+			self.slider.set_value(values["volume"])
+			self.label.set_markup(LABEL_FORMAT.format(volume_to_db(values["volume"])))
+		self.button.set_icon_name("audio-volume-muted" if values.get("mute") else "audio-volume-high")
 
+	@metrics.timed
 	def updateVolume(self, vol):
-		self.text.set_text("{:.0f}%".format(100 * max(vol) / VOLUME_NORM))
-		self.icon.set_text("♪")
-		self.slider.set_value(max(vol))
-		self._updatePopup()
+		frame.set_text(self.text, "{:.0f}%".format(100 * vol / VOLUME_NORM))
+		frame.set_text(self.icon, "♪")
+		self.popup.refresh()
 
+	@metrics.timed
 	def updateMute(self, mute):
-		self.set_opacity(0.5 if mute else 1)
-		self.button.set_icon_name("audio-volume-muted" if mute else "audio-volume-high")
+		frame.set_opacity(self, 0.5 if mute else 1)
+		self.popup.refresh()
 
 	def click(self, _, evt):
 		if (evt.button, evt.type) == (1, Gdk.EventType.BUTTON_PRESS):
-			if self.popup.is_visible():
-				self.popup.hide()
-			else:
-				self.popup.show_all()
-
-	def _updatePopup(self):
-		self.label.set_markup(LABEL_FORMAT.format(volume_to_db(int(self.slider.get_value()))))
+			self.popup.toggle()
 
 	def changeSlider(self, w, mode, val):
 		a = w.get_adjustment()
 		if val < a.get_lower(): val = a.get_lower()
 		if val > a.get_upper(): val = a.get_upper()
 		val = round(val / VOLUME_NORM * 100) * VOLUME_NORM / 100
-		self.default_sink.Set("org.PulseAudio.Core1.Device", "Volume", dbus.Array([int(val)], "u"), dbus_interface=PROPS)
-
-	def toggleMute(self, _):
-		self.default_sink.Set("org.PulseAudio.Core1.Device", "Mute", not self.default_sink.Get("org.PulseAudio.Core1.Device", "Mute", dbus_interface=PROPS), dbus_interface=PROPS)
-
-	def changeVolume(self, _, d):
-		val = max(self.default_sink.Get("org.PulseAudio.Core1.Device", "Volume", dbus_interface=PROPS))
-		val = round(val / VOLUME_NORM * 100 + d) * VOLUME_NORM / 100
-		if val < 0: val = 0
-		self.default_sink.Set("org.PulseAudio.Core1.Device", "Volume", dbus.Array([int(val)], "u"), dbus_interface=PROPS)
+		self.provider.setVolume(val)
@@ -1,7 +1,22 @@
-from gi.repository import Gtk, GLib
+from gi.repository import Gtk
 from simplewifi import wifi_status
+import util
+import frame
+from provider import Provider, shared
+import metrics
 
 __all__ = ["Wifi"]
+
+class WifiProvider(Provider):
+	def start(self):
+		self.every(1, self.update)
+		self.update()
+
+	@metrics.timed
+	def update(self):
+		self.publish("status", [tuple(s) for s in wifi_status()])
+		return True
+
 class Wifi(Gtk.EventBox):
 	def __init__(self, *, spacing=3):
 		super().__init__()
@@ -13,58 +28,36 @@ class Wifi(Gtk.EventBox):
 		box.pack_start(self.text, False, False, 0)
 		self.add(box)
 
-		self.tooltip = Gtk.Grid()
-		n = 0
-		def row(l):
-			nonlocal n
-			left = Gtk.Label(l, xalign=0)
-			right = Gtk.Label(xalign=1)
-			self.tooltip.attach(left, 0, n, 1, 1)
-			self.tooltip.attach(right, 1, n, 1, 1)
-			n += 1
-			return right
-		self.tt_name = row("Name")
-		self.tt_ssid = row("SSID")
-		self.tt_quality = row("Quality")
-		self.tt_ipv4 = row("IPv4")
-		self.tt_ipv6 = row("IPv6")
-		self.tt_mac = row("MAC")
-		self.tooltip.show_all()
-
-		def tooltip(self, x, y, keyboard, tooltip):
-			tooltip.set_custom(self.tooltip)
-			return True
-		self.connect("query-tooltip", tooltip)
-
-		GLib.timeout_add_seconds(1, self.update)
-		self.update()
+		self.provider = shared(WifiProvider)
+		self.tooltip = util.Tooltip(self,
+			lambda: util.rows(["Name", "SSID", "Quality", "IPv4", "IPv6", "MAC"]),
+			self.fill_tooltip,
+			lambda: self.provider.values.get("status", []))
+		self.provider.watch(self, "status", self.update)
 
 		self.icon.show()
 		self.text.show()
 		box.show()
 		self.show()
 
-	def update(self):
-		for (name, up, essid, quality, ipv4, ipv6, mac) in wifi_status():
+	@staticmethod
+	def connection(status):
+		for (name, up, essid, quality, ipv4, ipv6, mac) in status:
 			if essid is not None:
-				break
-		else:
-			(name, up, essid, quality, ipv4, ipv6, mac) = (None,) * 7
-
-		if up is not None and essid is not None:
-			self.set_opacity(1)
-			self.set_has_tooltip(True)
-			self.tt_name.set_text(name)
-			self.tt_ssid.set_text(essid)
-			self.tt_quality.set_text("{}%".format(quality or 0))
-			self.tt_ipv4.set_text(ipv4 or "-")
-			self.tt_ipv6.set_text(ipv6 or "-")
-			self.tt_mac.set_text(mac or "-")
-		else:
-			self.set_opacity(0.5)
-			self.set_has_tooltip(False)
-
-		self.icon.set_text({None: "", False:"", True: ""}[up])
-		self.text.set_text({None: "ERROR", False: "OFF", True: essid or "DOWN"}[up])
-
-		return True
+				return (name, up, essid, quality, ipv4, ipv6, mac)
+		return (None,) * 7
+
+	def fill_tooltip(self, tree, status):
+		(name, up, essid, quality, ipv4, ipv6, mac) = self.connection(status)
+		if up is None or essid is None: return False
+		for label, text in zip(tree.values, [name, essid, "{}%".format(quality or 0), ipv4 or "-", ipv6 or "-", mac or "-"]):
+			label.set_text(text)
+
+	@metrics.timed
+	def update(self, status):
+		(name, up, essid, quality, ipv4, ipv6, mac) = self.connection(status)
+		frame.set_opacity(self, 1 if up is not None and essid is not None else 0.5)
+		self.tooltip.changed()
+
+		frame.set_text(self.icon, {None: "", False:"", True: ""}[up])
+		frame.set_text(self.text, {None: "ERROR", False: "OFF", True: essid or "DOWN"}[up])
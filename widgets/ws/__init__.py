@@ -1,2 +1,21 @@
-from .workspaces import *
-from .i3 import *
+import importlib
+import startup
+
+registry = {
+	"Workspaces": "workspaces",
+	"i3": "i3",
+}
+
+__all__ = list(registry)
+
+def __getattr__(name):
+	if name not in registry:
+		raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+	with startup.span(f"import {__name__}.{registry[name]}"):
+		module = importlib.import_module("." + registry[name], __name__)
+	value = getattr(module, name)
+	globals()[name] = value
+	return value
+
+def __dir__():
+	return sorted(set(globals()) | set(__all__))
@@ -1,16 +1,22 @@
 from gi.repository import Gdk
 import asyncio
 from .workspaces import WSProvider
+import metrics
 from simplei3 import i3ipc
 
 __all__ = ["i3"]
 
 class i3(WSProvider):
-	def __init__(self):
-		super().__init__()
-		asyncio.ensure_future(self.start())
+	def start(self):
+		self.i3 = None
+		self.spawn(self.connect_i3())
 
-	async def start(self):
+	def close(self):
+		if self.i3 is not None:
+			self.i3.close()
+			self.i3 = None
+
+	async def connect_i3(self):
 		self.i3 = await i3ipc()
 
 		await self.i3.command(i3ipc.SUBSCRIBE, ["workspace", "barconfig_update"])
@@ -20,6 +26,7 @@ class i3(WSProvider):
 		for bar in await self.i3.command(i3ipc.GET_BAR_CONFIG):
 			self.barconfig(await self.i3.command(i3ipc.GET_BAR_CONFIG, bar))
 
+	@metrics.timed
 	async def get_workspaces(self):
 		ws = []
 		for w in await self.i3.command(i3ipc.GET_WORKSPACES):
@@ -27,17 +34,19 @@ class i3(WSProvider):
 				"focused": w["focused"],
 				"focused-other": w["visible"],
 				"urgent": w["urgent"],
+				"output": w.get("output"),
 			}
 			ws.append((w["name"], c))
-		self.emit("workspaces", ws)
+		self.publish("workspaces", ws)
 
 	def barconfig(self, barconfig):
 		if "focused_workspace_bg" in barconfig["colors"]:
 			color = Gdk.RGBA()
 			color.parse(barconfig["colors"]["focused_workspace_bg"])
-			self.emit("color", tuple(color))
+			self.publish("color", tuple(color))
 
 	async def on_event(self, type, payload):
+		if self.i3 is None: return
 		if type == i3ipc.E_WORKSPACE:
 			if payload["change"] in ["focus", "urgent"]:
 				await self.get_workspaces()
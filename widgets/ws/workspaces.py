@@ -1,33 +1,45 @@
 import gi
 gi.require_version("PangoCairo", "1.0")
-from gi.repository import Gtk, GObject, Gdk, Pango, PangoCairo
+from gi.repository import Gtk, GObject, Gdk, PangoCairo
 import cairo
+import util
+import frame
+from provider import Provider, shared
+import metrics
 
 __all__ = ["Workspaces"]
 
-class WSProvider(GObject.Object):
-	@GObject.Signal(arg_types=[object])
-	def color(self, rgb): pass
-	@GObject.Signal(arg_types=[object])
-	def workspaces(self, workspaces): pass
-
+class WSProvider(Provider):
+	# Publishes "color" (an RGBA tuple) and "workspaces" (a list of (name, state))
 	def set_workspace(self, name): pass
 
 class Workspaces(Gtk.Box):
-	def __init__(self, provider):
+	def __init__(self, provider, output=None):
 		super().__init__(spacing=1)
+		if isinstance(provider, type):
+			provider = shared(provider)
 		self.provider = provider
-		self.provider.connect("color", self.update_color)
-		self.provider.connect("workspaces", self.update_workspaces)
+		self.output = output
 		self.buttons = {}
 		self.active_color = (0, 0, 0, 0)
+		self.provider.watch(self, "color", self.update_color)
+		self.provider.watch(self, "workspaces", self.update_workspaces)
+
+	def set_output(self, output):
+		# Only show the workspaces on this output; None shows all of them
+		self.output = output
+		if "workspaces" in self.provider.values:
+			self.update_workspaces(self.provider.values["workspaces"])
 
-	def update_color(self, _, color):
+	def update_color(self, color):
 		for button in self.buttons.values():
 			button.set_color(color)
 		self.active_color = color
 
-	def update_workspaces(self, _, workspaces):
+	@metrics.timed
+	def update_workspaces(self, workspaces):
+		if self.output is not None:
+			workspaces = [(name, state) for (name, state) in workspaces if state.get("output") in (None, self.output)]
 		current = {a[0] for a in workspaces}
 		for name in list(self.buttons):
 			if name not in current:
@@ -57,16 +69,18 @@ class WorkspaceButton(Gtk.DrawingArea):
 		self.state = 0
 		self.active_color = color
 
-		pango = self.get_pango_context()
-		layout = Pango.Layout.new(pango)
-		layout.set_text(self.name, -1)
-		ext = layout.get_pixel_extents()[1]
-		self.set_size_request(2 + 2*PADDING + ext.width, 0)
+		self.style_cache = util.style_cache(self)
+		self.update_size()
+		self.connect("style-updated", self.update_size)
 
 		self.connect("draw", self.draw)
 		self.set_events(Gdk.EventMask.BUTTON_PRESS_MASK)
 		self.connect("button-press-event", self.on_mouse)
 
+	def update_size(self, *_):
+		ext = self.style_cache.layout(self.name).get_pixel_extents()[1]
+		self.set_size_request(2 + 2*PADDING + ext.width, 0)
+
 	def on_mouse(self, _, evt):
 		if (evt.button, evt.type) == (1, Gdk.EventType.BUTTON_PRESS):
 			self.emit("activate")
@@ -74,20 +88,20 @@ class WorkspaceButton(Gtk.DrawingArea):
 	def set_state(self, state):
 		if state != self.state:
 			self.state = state
-			self.queue_draw()
+			frame.queue_draw(self)
 
 	def set_color(self, color):
 		self.active_color = tuple(color)
-		self.queue_draw()
+		frame.queue_draw(self)
 
+	@metrics.timed
 	def draw(self, _, ctx):
 		ctx.set_antialias(cairo.ANTIALIAS_NONE)
 		ctx.set_line_width(1)
 		ctx.set_line_join(cairo.LINE_JOIN_BEVEL)
 		ctx.set_line_cap(cairo.LINE_CAP_BUTT)
 
-		style = self.get_style_context()
-		r, g, b, a = style.get_color(style.get_state())
+		r, g, b, a = self.style_cache.color()
 
 		w = self.get_allocated_width()
 		h = self.get_allocated_height()
@@ -133,9 +147,7 @@ class WorkspaceButton(Gtk.DrawingArea):
 			ctx.fill()
 		if text:
 			ctx.set_source_rgba(*text)
-			pango = self.get_pango_context()
-			layout = Pango.Layout.new(pango)
-			layout.set_text(self.name, -1)
+			layout = self.style_cache.layout(self.name)
 			ext = layout.get_pixel_extents()[1]
 			ctx.move_to((w-ext.width)/2, (h-ext.height)/2)
 			PangoCairo.show_layout(ctx, layout)
@@ -0,0 +1,11 @@
+__all__ = ["get"]
+
+display = None
+
+def get():
+	# One Xlib connection for the whole bar, opened on first use
+	global display
+	if display is None:
+		from Xlib import display as xdisplay
+		display = xdisplay.Display()
+	return display